@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from .db import connect_health_checks
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SurveyProject.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
+
+connect_health_checks()
@@ -0,0 +1,25 @@
+'''
+Caches which have to be shared by all processes serving the API, like the
+window of replica reads after a write and shared throttle buckets.
+'''
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+
+# Backends keeping nothing which other processes can read.
+UNSHARED_BACKENDS = (LocMemCache, DummyCache)
+
+
+def shared_cache(alias, purpose):
+    '''
+    Returns the cache of the alias or raises ImproperlyConfigured when it is
+    not shared between processes.
+    '''
+    cache = caches[alias]
+    if isinstance(cache, UNSHARED_BACKENDS):
+        raise ImproperlyConfigured(
+            f'{purpose} needs a cache shared by all processes, the {alias!r} cache '
+            f'is {type(cache).__name__}. Set CACHE_BACKEND and CACHE_LOCATION.')
+    return cache
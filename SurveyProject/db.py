@@ -0,0 +1,22 @@
+'''
+Health checks of persistent database connections. Django keeps connections
+open for CONN_MAX_AGE seconds but only notices a connection dropped by the
+database or a proxy after a query fails, so reused connections are checked
+once at the start of each request and closed when unusable, the request then
+opens a new one.
+'''
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+def connect_health_checks():
+    if settings.DB_HEALTH_CHECKS:
+        request_started.connect(check_connections,
+                                dispatch_uid='SurveyProject.db.check_connections')
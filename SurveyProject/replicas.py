@@ -0,0 +1,155 @@
+'''
+Routing of reads to replicas of the default database.
+
+Views marked with `replica_reads = True` read from one of DATABASE_REPLICAS
+on GET and HEAD requests, everything else reads and writes the default
+database. A client which has just written is kept on the default database
+for REPLICA_STICKY_SECONDS, so it reads its own writes however far replicas
+lag behind. Clients are told apart by their token, session or address, the
+sticky window is kept in the default cache, which has to be shared by all
+processes serving the API, the middleware refuses a cache local to the
+process.
+
+Replicas are checked by a query at most once in REPLICA_HEALTH_CHECK_INTERVAL
+seconds in each process, reads fall back to the default database when no
+replica is healthy.
+'''
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import random
+import time
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from .caches import shared_cache
+
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+replica_alias = contextvars.ContextVar('replica_alias', default=None)
+
+_health = {}
+_health_lock = Lock()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+@contextlib.contextmanager
+def primary():
+    '''
+    Reads from the default database inside the block, for example to render
+    a document which is cached for all clients.
+    '''
+    token = replica_alias.set(None)
+    try:
+        yield
+    finally:
+        replica_alias.reset(token)
+
+
+def check_replica(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        connections[alias].close()
+        return False
+    return True
+
+
+def replica_healthy(alias):
+    '''
+    Returns the last result of the health check of the replica, checking it
+    again once the result is older than the check interval.
+    '''
+    now = time.monotonic()
+    with _health_lock:
+        checked, healthy = _health.get(alias, (None, False))
+    if checked is None or now - checked >= settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        healthy = check_replica(alias)
+        with _health_lock:
+            _health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.DATABASE_REPLICAS if replica_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def sticky_key(request):
+    client = (request.META.get('HTTP_AUTHORIZATION')
+              or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+              or request.META.get('REMOTE_ADDR', ''))
+    return 'replicas:sticky:' + hashlib.md5(client.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.DATABASE_REPLICAS:
+            shared_cache('default', 'Reading from replicas')
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Marks the middleware as a coroutine function for the handler,
+            # like django.utils.deprecation.MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = replica_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+
+        if self.wrote(request, response):
+            self.stick(request)
+        return response
+
+    async def __acall__(self, request):
+        token = replica_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+
+        if self.wrote(request, response):
+            await sync_to_async(self.stick, thread_sensitive=False)(request)
+        return response
+
+    def wrote(self, request, response):
+        return (settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS
+                and response.status_code < 400)
+
+    def stick(self, request):
+        cache.set(sticky_key(request), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', view_func)
+        if (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS
+                and getattr(view, 'replica_reads', False)
+                and not cache.get(sticky_key(request))):
+            replica_alias.set(choose_replica())
@@ -1,16 +1,28 @@
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-SECRET_KEY = get_random_secret_key()
+# 'development' or 'production', the production profile turns DEBUG off and
+# keeps database connections open between requests.
+PROFILE = os.environ.get('DJANGO_PROFILE', 'development')
+
+# Workers of a multi-process server have to share the key, so the production
+# profile requires it by environment. A random key is used for development.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+
+if not SECRET_KEY:
+    if PROFILE == 'production':
+        raise ImproperlyConfigured('SECRET_KEY has to be set in the production profile.')
+    SECRET_KEY = get_random_secret_key()
 
 APPEND_SLASH = False
 
-DEBUG = True
+DEBUG = PROFILE != 'production'
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '*').split(',')
 
 
 INSTALLED_APPS = [
@@ -28,11 +40,29 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 100,
+    # Number of reverse proxies in front of the application whose
+    # X-Forwarded-For entries are trusted to identify clients, for example by
+    # throttles. With none the address of the connection is used, which
+    # clients cannot spoof.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 MIDDLEWARE = [
+    'api.instrumentation.PerformanceMiddleware',
+    'SurveyProject.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,17 +94,131 @@ WSGI_APPLICATION = 'SurveyProject.wsgi.application'
 
 
 
+# The database can be changed by environment, for example to run benchmarks
+# against SQLite: DB_ENGINE=django.db.backends.sqlite3 DB_NAME=bench.sqlite3
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': 5432,
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'postgres'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('DB_HOST', 'db'),
+        'PORT': int(os.environ.get('DB_PORT', 5432)),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE',
+                                           600 if PROFILE == 'production' else 0)),
+    }
+}
+
+# Read replicas of the default database by environment, separated by commas:
+# DB_REPLICA_HOSTS=replica1,replica2. With SQLite the values are names of
+# database files, to try the routing locally on a copy of the database.
+DATABASE_REPLICAS = []
+
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+                              start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    if DATABASES[alias]['ENGINE'].endswith('sqlite3'):
+        DATABASES[alias]['NAME'] = host
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['SurveyProject.replicas.ReplicaRouter']
+
+# Clients read from the default database for this many seconds after a write.
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+REPLICA_HEALTH_CHECK_INTERVAL = int(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 10))
+
+# Persistent connections are checked at the start of every request and
+# reopened when the database has dropped them, see SurveyProject/db.py.
+DB_HEALTH_CHECKS = PROFILE == 'production'
+
+# The default cache is local to each process unless CACHE_BACKEND and
+# CACHE_LOCATION give a shared one, for example
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache and
+# CACHE_LOCATION=memcached:11211. Replica reads and the 'cache' throttle
+# backend need a shared cache. The local-memory backend evicts least recently
+# used entries once MAX_ENTRIES is reached.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND',
+                                  'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+SURVEY_CACHE_ALIAS = os.environ.get('SURVEY_CACHE_ALIAS', 'default')
+
+SURVEY_CACHE_TIMEOUT = 60 * 60
+
+# 'sync' writes survey commits in the request, 'queue' only queues them for
+# the drain_commits management command and answers with a receipt.
+SURVEY_COMMIT_MODE = os.environ.get('SURVEY_COMMIT_MODE', 'sync')
+
+# Rejects commits of a survey already committed by the same customer. Commits
+# written in this mode are also kept unique by the database.
+SURVEY_SINGLE_COMMIT_PER_CUSTOMER = os.environ.get(
+    'SURVEY_SINGLE_COMMIT_PER_CUSTOMER', '') == 'true'
+
+# Requests making more queries are logged with their SQL by api.instrumentation.
+PERF_QUERY_LOG_THRESHOLD = int(os.environ.get('PERF_QUERY_LOG_THRESHOLD', 50))
+
+# Bearer token of scrapers of /metrics, which is served only to them and to
+# staff users.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Read endpoints are served by async views running in a pool of
+# ASYNC_DB_THREADS threads, which is enabled by the ASGI entry point.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == 'true'
+
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 20))
+
+# Resolved tokens are cached in process by api.authentication.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+# The documentation UI reads the pre-generated schema, see api/schema.py.
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'output': 'json'}),
+}
+
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'output': 'json'}),
+}
+
+SCHEMA_CACHE_TIMEOUT = 60 * 60
+
+# Token bucket rates of survey commits like '10/min' by api.throttling, per
+# customer, per client address and for all clients, empty to not throttle.
+# The production profile throttles by default.
+COMMIT_THROTTLE_RATES = {
+    scope: os.environ.get(f'COMMIT_THROTTLE_{scope.upper()}',
+                          default if PROFILE == 'production' else '') or None
+    for scope, default in (('customer', '10/min'), ('address', '60/min'),
+                           ('global', '1000/s'))
+}
+
+# 'local' keeps buckets in each process, 'cache' in THROTTLE_CACHE_ALIAS
+# shared by processes using the cache, which has to be a shared backend.
+COMMIT_THROTTLE_BACKEND = os.environ.get('COMMIT_THROTTLE_BACKEND', 'local')
+
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS', 'default')
+
+# Commits are shed with 503 by api.admission while as many are in flight in
+# the process or their average latency in seconds is above the limit.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 50))
+
+ADMISSION_MAX_LATENCY = float(os.environ.get('ADMISSION_MAX_LATENCY', 2.0))
+
+# Responses to commits with an Idempotency-Key are replayed for retries with
+# the key for this many seconds, expired keys are deleted by the
+# purge_idempotency_keys management command.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,5 +248,15 @@ USE_TZ = False
 
 STATIC_URL = '/static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+if PROFILE == 'production' and not ASYNC_VIEWS:
+    # Static files of the admin and of the docs are served by the application
+    # server when DEBUG is off. The middleware is synchronous only, under ASGI
+    # it would hold a thread for every request, static files should then be
+    # served by a separate server.
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -11,6 +11,10 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from .db import connect_health_checks
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SurveyProject.settings')
 
 application = get_wsgi_application()
+
+connect_health_checks()
@@ -0,0 +1,100 @@
+'''
+Admission control of survey commits. Commits in flight in the process, each
+holding a database connection, and their average latency are tracked; while
+either is above its limit new commits are shed with 503 and Retry-After
+instead of queueing up on an overloaded database.
+
+The average latency decays while no commit finishes, so shedding stops by
+itself once the database had time to recover.
+'''
+import math
+import time
+from threading import Lock
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# Weight of the latest commit in the average latency.
+LATENCY_WEIGHT = 0.2
+
+# Seconds in which the average latency halves while no commit finishes.
+LATENCY_HALF_LIFE = 5.0
+
+
+class Overloaded(APIException):
+    '''
+    The request is shed, DRF answers with Retry-After set from `wait`.
+    '''
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The service is overloaded, try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.in_flight = 0
+        self.latency = 0.0
+        self.updated = time.monotonic()
+        self.stats = {'admitted': 0, 'shed': 0}
+
+    def average_latency(self, now):
+        return self.latency * 0.5 ** ((now - self.updated) / LATENCY_HALF_LIFE)
+
+    def admit(self):
+        '''
+        Counts a commit in flight or raises Overloaded.
+        '''
+        with self.lock:
+            latency = self.average_latency(time.monotonic())
+            if latency > settings.ADMISSION_MAX_LATENCY:
+                self.stats['shed'] += 1
+                raise Overloaded(wait=math.ceil(
+                    LATENCY_HALF_LIFE * math.log2(latency / settings.ADMISSION_MAX_LATENCY)))
+            if self.in_flight >= settings.ADMISSION_MAX_IN_FLIGHT:
+                self.stats['shed'] += 1
+                raise Overloaded(wait=1)
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+
+    def release(self, duration):
+        with self.lock:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.latency = ((1 - LATENCY_WEIGHT) * self.average_latency(now)
+                            + LATENCY_WEIGHT * duration)
+            self.updated = now
+
+    def reset(self):
+        with self.lock:
+            self.in_flight = 0
+            self.latency = 0.0
+
+
+admission_controller = AdmissionController()
+
+
+class AdmissionControlMixin:
+    '''
+    Admits POST requests of a view through the admission controller after
+    authentication, permissions and throttles are checked.
+    '''
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method == 'POST':
+            admission_controller.admit()
+            request._admitted = time.perf_counter()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        admitted = getattr(request, '_admitted', None)
+        if admitted is not None:
+            request._admitted = None
+            admission_controller.release(time.perf_counter() - admitted)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,62 @@
+'''
+Async versions of the API views for the ASGI entry point. Django 3.2 has no
+async ORM and DRF views are synchronous, so a view is run as a whole in
+a bounded pool of threads: the event loop holds any number of waiting or slow
+client connections, while the number of requests using the database at once,
+and so the number of database connections, is bounded by the pool size.
+'''
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from SurveyProject.db import check_connections
+
+
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS,
+                              thread_name_prefix='api-db')
+
+
+def run_view(view, request, *args, **kwargs):
+    '''
+    Runs a sync view in a thread of the pool and renders its response there,
+    database connections of the thread are maintained like the request cycle
+    does it.
+    '''
+    close_old_connections()
+    if settings.DB_HEALTH_CHECKS:
+        check_connections()
+    try:
+        timing = getattr(request, '_timing', None)
+        if timing is None:
+            response = view(request, *args, **kwargs)
+        else:
+            with timing.wrap_connections():
+                response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def pooled_view(view):
+    '''
+    Returns an async view running the view in the pool. Attributes of the
+    view, like `csrf_exempt` and `cls` of DRF views, are kept.
+    '''
+    async def async_view(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Context variables, like the database chosen for reads, are not
+        # passed to executor threads by the loop.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            executor, functools.partial(context.run, run_view, view, request, *args, **kwargs))
+
+    async_view.__dict__.update(view.__dict__)
+    async_view.__name__ = view.__name__
+    async_view.__doc__ = view.__doc__
+    return async_view
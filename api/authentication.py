@@ -0,0 +1,95 @@
+'''
+Token authentication with an in-process cache of resolved tokens, so requests
+of the same client do not join Token and User on every request.
+'''
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from SurveyProject.replicas import primary
+
+
+class TokenCache:
+    '''
+    LRU cache of (user, token) pairs by token keys, entries expire after
+    TOKEN_CACHE_TTL seconds and at most TOKEN_CACHE_SIZE of them are kept.
+    '''
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + settings.TOKEN_CACHE_TTL, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            for key in [key for key, (expires, (user, token)) in self.entries.items()
+                        if user.pk == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Drop-in replacement of TokenAuthentication caching resolved tokens.
+    Entries are dropped when their token is deleted or their user is saved,
+    for example deactivated, in this process, other processes notice it
+    within TOKEN_CACHE_TTL seconds.
+    '''
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # Tokens are read from the default database, a replica may not
+            # have a token obtained a moment ago yet.
+            with primary():
+                cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        return copy.copy(user), token
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, **kwargs):
+    token_cache.delete_user(instance.pk)
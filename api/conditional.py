@@ -0,0 +1,67 @@
+'''
+Validators for conditional GET requests. Each endpoint gets an ETag computed
+from `modified` fields only, and instances a Last-Modified date as well, so
+unchanged resources are answered with 304 Not Modified without serializing
+them.
+'''
+import hashlib
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .pagination import IdCursorPagination
+
+
+def instance_validators(queryset):
+    '''
+    Returns validators for one instance looked up by the `pk` url kwarg.
+    '''
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, '_validators'):
+            modified = queryset.filter(pk=kwargs['pk']).values_list(
+                'modified', flat=True).first()
+            if modified is None:
+                request._validators = (None, None)
+            else:
+                request._validators = (f'{kwargs["pk"]}-{modified.timestamp()}',
+                                       modified)
+        return request._validators
+    return validators
+
+
+def list_validators(get_queryset, pagination_class=IdCursorPagination):
+    '''
+    Returns validators for a page of a list. The ETag covers the cursor, ids
+    and modification times of the instances on the page and whether pages
+    follow or precede it, so changes within the page and around it change it
+    as well. The page is read by the same index range scan as the view
+    reads it, whatever the size of the list. Pages have no Last-Modified date,
+    as the latest modification time of the remaining rows does not move when
+    a row is deleted.
+    '''
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, '_validators'):
+            queryset = get_queryset(request, *args, **kwargs)
+            paginator = pagination_class()
+            page = paginator.paginate_queryset(queryset, request)
+            digest = hashlib.md5(request.get_full_path().encode())
+            if page is None:
+                page = queryset.order_by('pk')
+            else:
+                digest.update(f'{paginator.has_next}-{paginator.has_previous};'.encode())
+            for instance in page:
+                digest.update(f'{instance.pk}-{instance.modified.timestamp()};'.encode())
+            request._validators = (digest.hexdigest(), None)
+        return request._validators
+    return validators
+
+
+def conditional(validators):
+    '''
+    Decorator for `get` methods of views to support If-None-Match and
+    If-Modified-Since headers.
+    '''
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+        ))
@@ -0,0 +1,86 @@
+'''
+Idempotency-Key support of survey commits. The first successful response to
+a key is stored with a hash of the request in the transaction of the commit
+and replayed for retries with the same key, without writing the commit
+again, until IDEMPOTENCY_KEY_TTL seconds have passed. Failed requests are
+not stored, so they can be retried with the same key.
+'''
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from surveys.models import IdempotencyKey
+
+
+KEY_MAX_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def replay(stored, digest):
+    if stored.request_hash != digest:
+        return Response({'detail': 'Idempotency-Key was already used for another request.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored.response, status=stored.status_code,
+                    headers=dict(stored.headers, **{'Idempotent-Replayed': 'true'}))
+
+
+def idempotent_response(request, key, respond):
+    '''
+    Returns the stored response to the key or the response of `respond`,
+    which is called in the transaction storing it.
+    '''
+    if not key or len(key) > KEY_MAX_LENGTH:
+        return Response({'detail': f'Idempotency-Key must have 1 to {KEY_MAX_LENGTH} characters.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    digest = request_hash(request)
+    now = timezone.now()
+
+    stored = IdempotencyKey.objects.filter(key=key).first()
+    if stored is not None:
+        if stored.expires > now:
+            return replay(stored, digest)
+        stored.delete()
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                stored = IdempotencyKey.objects.create(
+                    key=key, request_hash=digest,
+                    expires=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL))
+        except IntegrityError:
+            stored = None
+        else:
+            response = respond()
+            if status.is_success(response.status_code):
+                stored.status_code = response.status_code
+                stored.response = response.data
+                stored.headers = {name: value for name, value in response.items()
+                                  if name != 'Content-Type'}
+                stored.save(update_fields=['status_code', 'response', 'headers'])
+            else:
+                transaction.set_rollback(True)
+            return response
+
+    # A concurrent request with the key has committed in the meantime.
+    return replay(IdempotencyKey.objects.get(key=key), digest)
+
+
+def purge_expired(batch_size):
+    '''
+    Deletes one batch of expired keys. Returns the batch size.
+    '''
+    expired = list(IdempotencyKey.objects.filter(
+        expires__lte=timezone.now()
+        ).values_list('pk', flat=True)[:batch_size])
+    IdempotencyKey.objects.filter(pk__in=expired).delete()
+    return len(expired)
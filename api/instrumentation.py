@@ -0,0 +1,236 @@
+'''
+Per-request performance instrumentation. The middleware measures wall time,
+database queries and their time, time spent in the view and in rendering,
+returns them in a Server-Timing header and aggregates them into histograms
+per url pattern, which are exposed in Prometheus text format by `metrics` to
+staff users and to scrapers sending METRICS_TOKEN.
+
+Under ASGI the middleware runs asynchronously, queries are then counted in
+the threads running views, see api.async_views.
+'''
+import asyncio
+import hmac
+import logging
+import time
+from contextlib import ExitStack
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from surveys import cache as survey_cache
+from .authentication import token_cache
+from .admission import admission_controller
+
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    '''
+    Cumulative histogram with labels, formatted like a Prometheus histogram.
+    '''
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+        self.lock = Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts, total, count = self.series.get(labels, ([0] * len(self.buckets), 0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.series[labels] = (counts, total + value, count + 1)
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                label_text = ','.join(f'{name}="{value}"' for name, value in labels)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    yield f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}'
+                yield f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}'
+                yield f'{self.name}_sum{{{label_text}}} {total}'
+                yield f'{self.name}_count{{{label_text}}} {count}'
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds',
+                             'Wall time of requests.', DURATION_BUCKETS)
+DB_DURATION = Histogram('http_request_db_duration_seconds',
+                        'Time of database queries of requests.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries',
+                       'Number of database queries of requests.', QUERY_BUCKETS)
+APP_DURATION = Histogram('http_request_app_duration_seconds',
+                         'Time of views, mostly serialization, without queries.',
+                         DURATION_BUCKETS)
+RENDER_DURATION = Histogram('http_request_render_duration_seconds',
+                            'Time of rendering responses.', DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes',
+                          'Size of response bodies.', SIZE_BUCKETS)
+
+HISTOGRAMS = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, APP_DURATION,
+              RENDER_DURATION, RESPONSE_SIZE]
+
+
+class RequestTiming:
+    '''
+    Timings of one request, also used as an execute wrapper of database
+    connections to count queries.
+    '''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.rendered = None
+        self.queries = []
+        self.db_duration = 0.0
+        self.view_db_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_duration += time.perf_counter() - start
+            self.queries.append(sql)
+
+    def wrap_connections(self):
+        '''
+        Returns a context manager counting queries of all database
+        connections of the current thread.
+        '''
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    def view_done(self, response):
+        self.view_finished = time.perf_counter()
+        self.view_db_duration = self.db_duration
+
+    def render_done(self, response):
+        self.rendered = time.perf_counter()
+
+    @property
+    def app_duration(self):
+        if self.view_started is None or self.view_finished is None:
+            return 0.0
+        return max(0.0, self.view_finished - self.view_started - self.view_db_duration)
+
+    @property
+    def render_duration(self):
+        if self.view_finished is None or self.rendered is None:
+            return 0.0
+        return self.rendered - self.view_finished
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Marks the middleware as a coroutine function for the handler,
+            # like django.utils.deprecation.MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        request._timing = timing
+        with timing.wrap_connections():
+            response = self.get_response(request)
+        return self.record(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        request._timing = timing
+        response = await self.get_response(request)
+        return self.record(request, response, timing)
+
+    def record(self, request, response, timing):
+        if timing.view_finished is None:
+            timing.view_done(response)
+        duration = time.perf_counter() - timing.started
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={duration * 1000:.2f}',
+            f'db;dur={timing.db_duration * 1000:.2f};desc="{len(timing.queries)} queries"',
+            f'app;dur={timing.app_duration * 1000:.2f}',
+            f'render;dur={timing.render_duration * 1000:.2f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        labels = (('method', request.method),
+                  ('route', match.route if match is not None else 'unmatched'))
+        REQUEST_DURATION.observe(labels, duration)
+        DB_DURATION.observe(labels, timing.db_duration)
+        DB_QUERIES.observe(labels, len(timing.queries))
+        APP_DURATION.observe(labels, timing.app_duration)
+        RENDER_DURATION.observe(labels, timing.render_duration)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+        if len(timing.queries) > settings.PERF_QUERY_LOG_THRESHOLD:
+            logger.warning('%s %s made %d queries:\n%s', request.method, request.path,
+                           len(timing.queries), '\n'.join(timing.queries))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._timing.view_done(response)
+        response.add_post_render_callback(request._timing.render_done)
+        return response
+
+
+def metrics_allowed(request):
+    '''
+    Metrics are served to active staff users and to requests with METRICS_TOKEN
+    as a bearer token, they are not public. Tokens are compared as bytes, as
+    `hmac.compare_digest` refuses strings with non-ASCII characters.
+    '''
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    return bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {settings.METRICS_TOKEN}'.encode())
+
+
+def metrics(request):
+    '''
+    Returns histograms of all instrumented requests of the process and
+    counters of the survey and token caches and of commit admission in
+    Prometheus text format.
+    '''
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.lines())
+    for name, value in survey_cache.stats().items():
+        lines.append(f'# TYPE survey_cache_{name}_total counter')
+        lines.append(f'survey_cache_{name}_total {value}')
+    for name, value in dict(token_cache.stats).items():
+        lines.append(f'# TYPE token_cache_{name}_total counter')
+        lines.append(f'token_cache_{name}_total {value}')
+    for name, value in dict(admission_controller.stats).items():
+        lines.append(f'# TYPE commit_admission_{name}_total counter')
+        lines.append(f'commit_admission_{name}_total {value}')
+    lines.append('# TYPE commit_admission_in_flight gauge')
+    lines.append(f'commit_admission_in_flight {admission_controller.in_flight}')
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+'''
+Keyset pagination for list endpoints. A cursor keeps the position of the last
+listed instance, so any page is read by an index range scan instead of an
+offset, and pages do not shift when new instances are added.
+'''
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    '''
+    Pages ordered by id. The page size is taken from PAGE_SIZE setting and can
+    be changed per request by the `page_size` query parameter.
+    '''
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class SurveyCursorPagination(IdCursorPagination):
+    '''
+    Pages of surveys ordered by start date, newest first.
+    '''
+    ordering = ('-start_date', 'id')
@@ -0,0 +1,87 @@
+'''
+Pre-generated OpenAPI schema. Generating the schema walks every view and
+serializer, so it is generated by the generate_schema management command
+into api/openapi.json, committed together with the code, and served from
+that file with an ETag and caching headers. The test suite fails when the
+committed schema differs from the one generated from the code.
+'''
+import hashlib
+import json
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, yaml_sane_dump
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+from rest_framework.request import Request
+
+
+SCHEMA_PATH = Path(__file__).resolve().parent / 'openapi.json'
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+
+info = openapi.Info(
+   title="Survey API",
+   default_version='v1',
+   description='''API service for surveys, their creating, updating, deleteing,
+   reading and commiting''',
+   contact=openapi.Contact(email="iliia.berniak@gmail.com"),
+)
+
+schema_view = get_schema_view(
+   info,
+   public=True,
+   permission_classes=(permissions.AllowAny,),
+)
+
+_documents = {}
+
+
+def generate_schema():
+    '''
+    Returns the schema generated from the code as pretty printed JSON, without
+    a host so the same file is served by any deployment. Views are inspected
+    with a GET request like the schema view of drf_yasg does.
+    '''
+    request = Request(RequestFactory().get('/api/swagger.json'))
+    schema = OpenAPISchemaGenerator(info, url='').get_schema(request=request, public=True)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(schema)
+
+
+def get_document(output):
+    '''
+    Returns the schema in the output format with its ETag, read from the
+    committed file once per process. Without the file the schema is
+    generated instead.
+    '''
+    if output not in _documents:
+        if SCHEMA_PATH.exists():
+            content = SCHEMA_PATH.read_bytes()
+        else:
+            content = generate_schema()
+        if output == 'yaml':
+            content = yaml_sane_dump(json.loads(content, object_pairs_hook=OrderedDict),
+                                     binary=True)
+        _documents[output] = content, hashlib.md5(content).hexdigest()
+    return _documents[output]
+
+
+@condition(etag_func=lambda request, output: get_document(output)[1])
+def schema(request, output):
+    '''
+    Serves the pre-generated schema as JSON or YAML.
+    '''
+    content, etag = get_document(output)
+    response = HttpResponse(content, content_type=CONTENT_TYPES[output])
+    patch_cache_control(response, public=True, max_age=settings.SCHEMA_CACHE_TIMEOUT)
+    return response
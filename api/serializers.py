@@ -1,5 +1,10 @@
 from rest_framework import serializers
 from surveys.models import *
+from django.conf import settings
+from django.db import IntegrityError
+from surveys.commits import write_commits, given_answer
+from surveys.authoring import write_survey_tree
+from surveys import validation
 from django.shortcuts import get_object_or_404
 
 
@@ -13,6 +18,23 @@ class SurveySerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'start_date', 'finish_date', 'description')
 
 
+class SurveyReadSerializer(serializers.BaseSerializer):
+    '''
+    Read-only serializer giving the same output as SurveySerializer without
+    the field machinery of model serializers.
+    '''
+    datetime_field = serializers.DateTimeField()
+
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'title': instance.title,
+            'start_date': self.datetime_field.to_representation(instance.start_date),
+            'finish_date': self.datetime_field.to_representation(instance.finish_date),
+            'description': instance.description,
+        }
+
+
 class SurveyDetailSerializer(SurveySerializer):
     '''
     Serializer for survey's detail view, include nested field for questions and
@@ -20,16 +42,134 @@ class SurveyDetailSerializer(SurveySerializer):
     '''
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        count = 1
+        questions = QuestionNestedSerializer(self.context['questions'], many=True)
+        representation['questions'] = dict(enumerate(questions.data, start=1))
+        return representation
+
+
+class SurveyResultsSerializer(SurveySerializer):
+    '''
+    Serializer for survey's results, include nested field for questions with
+    numbers of given answers for each preset answer.
+    '''
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        counts = {}
+        totals = {}
+        for stat in self.context['stats']:
+            counts[stat.question_id, stat.answer_id] = stat.count
+            totals[stat.question_id] = totals.get(stat.question_id, 0) + stat.count
         representation['questions'] = {}
-        for question in self.context['questions']:
-            question_serializer = QuestionNestedSerializer(question,
-                                                           context={'question': question})
-            representation['questions'][count] = question_serializer.data
-            count +=1
+        for number, question in enumerate(self.context['questions'], start=1):
+            representation['questions'][number] = {
+                'id': question.id,
+                'text': question.text,
+                'answer_type': question.answer_type,
+                'given_answers': totals.get(question.id, 0),
+            }
+            if question.answer_type != 'ta':
+                representation['questions'][number]['answers'] = [
+                    {'id': answer.id,
+                     'text': answer.text,
+                     'count': counts.get((question.id, answer.id), 0)}
+                    for answer in question.answer_set.all()]
         return representation
 
 
+class AnswerTreeSerializer(serializers.Serializer):
+    '''
+    Serializer to write a preset answer inside a survey tree. An answer with
+    `id` is updated, without it is created.
+    '''
+    id = serializers.IntegerField(required=False)
+    text = serializers.CharField(allow_blank=True)
+
+
+class QuestionTreeSerializer(serializers.Serializer):
+    '''
+    Serializer to write a question with its preset answers inside a survey
+    tree. A question with `id` is updated, without it is created.
+    '''
+    id = serializers.IntegerField(required=False)
+    text = serializers.CharField(allow_blank=True)
+    answer_type = serializers.ChoiceField(choices=Question.ANSWER_TYPE_CHOICES,
+                                          default='ta')
+    answers = AnswerTreeSerializer(many=True, required=False)
+
+    def validate(self, data):
+        data.setdefault('answers', [])
+        if data['answer_type'] == 'ta' and data['answers']:
+            raise serializers.ValidationError(
+                              {'answers': 'A text answer question has no preset answers'})
+        return data
+
+
+class SurveyTreeSerializer(SurveySerializer):
+    '''
+    Serializer to write a survey with all its questions and preset answers in
+    one action. Without an instance the whole tree is created, with an
+    instance it is upserted: listed questions and answers with `id` are
+    updated, ones without `id` are created. Ids of the tree are checked by two
+    queries for the whole tree.
+    '''
+    questions = QuestionTreeSerializer(many=True, write_only=True)
+
+    class Meta(SurveySerializer.Meta):
+        fields = SurveySerializer.Meta.fields + ('questions',)
+
+    def validate(self, data):
+        questions = [each['id'] for each in data['questions'] if 'id' in each]
+        answers = [answer['id'] for each in data['questions']
+                   for answer in each['answers'] if 'id' in answer]
+        if len(set(questions)) != len(questions) or len(set(answers)) != len(answers):
+            raise serializers.ValidationError(
+                              {'questions': 'Each id is given only once'})
+        questions, answers = set(questions), set(answers)
+        if self.instance is None:
+            if questions or answers:
+                raise serializers.ValidationError(
+                                  {'questions': 'Ids are given only to update a survey'})
+            return data
+
+        belonged = set(Question.objects.filter(
+            survey=self.instance, pk__in=questions
+            ).values_list('pk', flat=True))
+        if questions - belonged:
+            foreign = ', '.join(str(pk) for pk in sorted(questions - belonged))
+            raise serializers.ValidationError(
+                {'questions': f'Questions {foreign} do not belong to the survey'})
+
+        owners = dict(Answer.objects.filter(
+            question__survey=self.instance, pk__in=answers
+            ).values_list('pk', 'question_id'))
+        foreign = sorted(answer['id'] for each in data['questions']
+                         for answer in each['answers']
+                         if 'id' in answer and owners.get(answer['id']) != each.get('id'))
+        if foreign:
+            foreign = ', '.join(str(pk) for pk in foreign)
+            raise serializers.ValidationError(
+                {'questions': f'Answers {foreign} do not belong to their questions'})
+        return data
+
+    def create(self, validated_data):
+        questions_validated_data = validated_data.pop('questions')
+        return write_survey_tree(Survey(**validated_data),
+                                 self.questions_tree(questions_validated_data))
+
+    def update(self, instance, validated_data):
+        questions_validated_data = validated_data.pop('questions')
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        return write_survey_tree(instance, self.questions_tree(questions_validated_data))
+
+    def questions_tree(self, questions_validated_data):
+        return [(Question(id=each.get('id'), text=each['text'],
+                          answer_type=each['answer_type']),
+                 [Answer(id=answer.get('id'), text=answer['text'])
+                  for answer in each['answers']])
+                for each in questions_validated_data]
+
+
 class SurveyTitleSerializer(serializers.ModelSerializer):
     '''
     Serializer for titles when used like nested.
@@ -70,7 +210,8 @@ class QuestionNewSerializer(serializers.ModelSerializer):
 class QuestionNestedSerializer(serializers.ModelSerializer):
     '''
     Question serializer which uses for nested serializing in detail survey
-    serializer.
+    serializer. Preset answers are read from `answer_set`, so a queryset with
+    `prefetch_related('answer_set')` is serialized without extra queries.
     '''
     class Meta:
         model = Question
@@ -78,9 +219,8 @@ class QuestionNestedSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if self.context['question'].answer_type != 'ta':
-            answers_queryset = Answer.objects.filter(question=self.context['question'])
-            answers = AnswerSerializer(answers_queryset, many=True)
+        if instance.answer_type != 'ta':
+            answers = AnswerReadSerializer(instance.answer_set.all(), many=True)
             representation['answers'] = answers.data
         return representation
 
@@ -95,6 +235,15 @@ class AnswerSerializer(serializers.ModelSerializer):
         fields = ('id', 'text', 'question')
 
 
+class AnswerReadSerializer(serializers.BaseSerializer):
+    '''
+    Read-only serializer giving the same output as AnswerSerializer without
+    the field machinery of model serializers.
+    '''
+    def to_representation(self, instance):
+        return {'id': instance.id, 'text': instance.text, 'question': instance.question_id}
+
+
 class AnswerNewSerializer(serializers.ModelSerializer):
     '''
     Answer serializer for creating a new instance.
@@ -138,35 +287,73 @@ class GivenAnswerSerializer(serializers.ModelSerializer):
     Serializer to read for GivenAnswer model.
     '''
     question = serializers.SlugRelatedField(read_only=True, slug_field='text')
+    answer = serializers.CharField(read_only=True, source='text')
     class Meta:
         model = GivenAnswer
         fields = ['question', 'answer']
 
 
+class GivenAnswerReadSerializer(serializers.BaseSerializer):
+    '''
+    Read-only serializer giving the same output as GivenAnswerSerializer
+    without the field machinery of model serializers.
+    '''
+    def to_representation(self, instance):
+        return {
+            'question': instance.question.text if instance.question_id else None,
+            'answer': instance.text,
+        }
+
+
+class GivenAnswerCommitSerializer(serializers.Serializer):
+    '''
+    Serializer to write a given answer inside a commit. Answers are checked
+    by SurveyCommitSerializer for all given answers at once.
+    '''
+    question = serializers.IntegerField()
+    answer = serializers.CharField()
+
+
 class SurveyCommitSerializer(serializers.ModelSerializer):
     '''
     Serializer to create a new instance for CompletedSurvey model and new
-    instances for GivenAnswer model in one action.
+    instances for GivenAnswer model in one action. Given answers are checked
+    against the cached validation plan of the survey.
     '''
-    given_answers = GivenAnswerSerializer(many=True, write_only=True)
+    given_answers = GivenAnswerCommitSerializer(many=True, write_only=True)
 
     class Meta:
         model = CompletedSurvey
         fields = ['customer', 'survey', 'given_answers']
 
-    def create(self, validated_data):
+    def validate(self, data):
+        plan = validation.get_plan(data['survey'] and data['survey'].pk)
+        errors = validation.check_given_answers(
+            plan, ((each['question'], each['answer']) for each in data['given_answers']))
+        if errors:
+            raise serializers.ValidationError({'given_answers': errors})
+        for each in data['given_answers']:
+            each['choice'] = validation.choice_id(plan, each['question'], each['answer'])
+
+        if settings.SURVEY_SINGLE_COMMIT_PER_CUSTOMER and CompletedSurvey.objects.filter(
+                customer=data['customer'], survey=data['survey']).exists():
+            raise serializers.ValidationError(
+                              'The survey is already committed by the customer')
+        return data
 
+    def create(self, validated_data):
         answers_validated_data = validated_data.pop('given_answers')
-        survey = validated_data['survey']
-        completed_survey = CompletedSurvey.objects.create(**validated_data)
-
-        given_answers_serializer = self.fields['given_answers']
-
-        for each in answers_validated_data:
-            each['completed_survey'] = completed_survey
-
-        answers = given_answers_serializer.create(answers_validated_data)
-
+        completed_survey = CompletedSurvey(**validated_data)
+        answers = [given_answer(each) for each in answers_validated_data]
+        try:
+            write_commits([(completed_survey, answers)])
+        except IntegrityError:
+            # A concurrent commit of the survey by the customer won.
+            if settings.SURVEY_SINGLE_COMMIT_PER_CUSTOMER and CompletedSurvey.objects.filter(
+                    customer=completed_survey.customer, survey=completed_survey.survey).exists():
+                raise serializers.ValidationError(
+                                  'The survey is already committed by the customer')
+            raise
         return completed_survey
 
 
@@ -182,10 +369,41 @@ class ComplSurvDetailSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        count = 1
-        representation['given_answers'] = {}
-        for answer in self.context['answers']:
-            given_answer_serializer = GivenAnswerSerializer(answer)
-            representation['given_answers'][count] = given_answer_serializer.data
-            count +=1
+        answers = GivenAnswerReadSerializer(self.context['answers'], many=True)
+        representation['given_answers'] = dict(enumerate(answers.data, start=1))
         return representation
+
+
+class CompletedSurveyHistorySerializer(serializers.BaseSerializer):
+    '''
+    Read-only serializer for a completed survey in a customer's history, with
+    the survey's title and all given answers embedded. Given answers are read
+    from `givenanswer_set`, so a queryset prefetching them with their
+    questions and choices is serialized without extra queries. Given answers
+    of archived completed surveys are taken from `archived_answers` of the
+    context, by ids of the archived completed surveys.
+    '''
+    datetime_field = serializers.DateTimeField()
+
+    def to_representation(self, instance):
+        if isinstance(instance, ArchivedCompletedSurvey):
+            answers = self.context['archived_answers'][instance.pk]
+        else:
+            answers = instance.givenanswer_set.all()
+        answers = GivenAnswerReadSerializer(answers, many=True)
+        return {
+            'id': instance.id,
+            'survey': instance.survey and {'id': instance.survey.id,
+                                           'title': instance.survey.title},
+            'created': self.datetime_field.to_representation(instance.created),
+            'given_answers': dict(enumerate(answers.data, start=1)),
+        }
+
+
+class PendingCommitSerializer(serializers.ModelSerializer):
+    '''
+    Serializer to read a receipt of a queued commit.
+    '''
+    class Meta:
+        model = PendingCommit
+        fields = ['receipt', 'status', 'received', 'completed_survey', 'error']
@@ -0,0 +1,135 @@
+'''
+Token bucket throttling of survey commits per customer, per client address
+and for all clients together. A bucket holds at most the number of requests
+of its rate and is refilled continuously at that rate, so bursts up to the
+bucket size pass while the average is kept to the rate.
+
+Buckets are kept in process by the 'local' backend, each process then
+allows the whole rate, or in the THROTTLE_CACHE_ALIAS cache by the 'cache'
+backend, shared by all processes using the cache. The 'cache' backend refuses
+a cache local to the process. Updates of a cached bucket are not atomic,
+concurrent requests can exceed the rate slightly.
+'''
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from SurveyProject.caches import shared_cache
+
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    '''
+    Returns the number of requests and the duration in seconds of a rate
+    like '10/min'.
+    '''
+    number, period = rate.split('/')
+    return int(number), DURATIONS[period[0]]
+
+
+def take_token(bucket, number, duration, now):
+    '''
+    Takes a token from the bucket, a pair of tokens left and the time it was
+    updated, None for a full bucket. Returns the updated bucket and the
+    seconds to wait for a token when none is left.
+    '''
+    tokens, updated = bucket or (number, now)
+    tokens = min(number, tokens + (now - updated) * number / duration)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) * duration / number
+
+
+class LocalBuckets:
+    '''
+    Buckets of the process, at most `size` recently used ones are kept.
+    '''
+    def __init__(self, size=100000):
+        self.size = size
+        self.buckets = OrderedDict()
+        self.lock = Lock()
+
+    def take(self, key, number, duration):
+        with self.lock:
+            self.buckets[key], wait = take_token(self.buckets.get(key), number, duration,
+                                                 time.monotonic())
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.size:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    '''
+    Buckets in the shared cache, a bucket expires once it would be full again.
+    '''
+    def take(self, key, number, duration):
+        cache = shared_cache(settings.THROTTLE_CACHE_ALIAS, "The 'cache' throttle backend")
+        key = f'throttle:{key}'
+        bucket, wait = take_token(cache.get(key), number, duration, time.time())
+        cache.set(key, bucket, timeout=duration)
+        return wait
+
+
+local_buckets = LocalBuckets()
+
+cache_buckets = CacheBuckets()
+
+
+def get_buckets():
+    if settings.COMMIT_THROTTLE_BACKEND == 'cache':
+        return cache_buckets
+    return local_buckets
+
+
+class CommitThrottle(BaseThrottle):
+    '''
+    Throttles POST requests by the COMMIT_THROTTLE_RATES rate of the scope,
+    a scope without a rate is not throttled.
+    '''
+    scope = None
+
+    def get_bucket_key(self, request, view):
+        raise NotImplementedError('.get_bucket_key() must be overridden')
+
+    def allow_request(self, request, view):
+        rate = settings.COMMIT_THROTTLE_RATES.get(self.scope)
+        if rate is None or request.method != 'POST':
+            return True
+        number, duration = parse_rate(rate)
+        self.wait_time = get_buckets().take(
+            f'{self.scope}:{self.get_bucket_key(request, view)}', number, duration)
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time
+
+
+class CustomerCommitThrottle(CommitThrottle):
+    scope = 'customer'
+
+    def get_bucket_key(self, request, view):
+        return view.kwargs['pk']
+
+
+class AddressCommitThrottle(CommitThrottle):
+    scope = 'address'
+
+    def get_bucket_key(self, request, view):
+        return self.get_ident(request)
+
+
+class GlobalCommitThrottle(CommitThrottle):
+    scope = 'global'
+
+    def get_bucket_key(self, request, view):
+        return 'all'
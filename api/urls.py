@@ -8,40 +8,40 @@ recieved from 'authentication/' url with username and password.
 On collections' endpoints GET for list and POST for creating are provided.
 On concrete instance endpoints GET for detail PUT for editing and DELETE for deleting.
 '''
+from django.conf import settings
 from django.urls import path, re_path
 from rest_framework.authtoken import views
 from .views import *
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from .async_views import pooled_view
+from .schema import schema, schema_view
+
+def read_view(view):
+    '''
+    Read-heavy endpoints are served by async views under ASGI.
+    '''
+    return pooled_view(view) if settings.ASYNC_VIEWS else view
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Survey API",
-      default_version='v1',
-      description='''API service for surveys, their creating, updating, deleteing,
-      reading and commiting''',
-      contact=openapi.Contact(email="iliia.berniak@gmail.com"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
 
 urlpatterns = [
     path('authentication/', views.ObtainAuthToken.as_view()),
-    path('surveys/', SurveyView.as_view()),
-    path('surveys/<int:pk>/', SurveyDetailView.as_view()),
-    path('surveys/<int:pk>/questions/', QuestionsView.as_view()),
+    path('surveys/', read_view(SurveyView.as_view())),
+    path('surveys/<int:pk>/', read_view(SurveyDetailView.as_view())),
+    path('surveys/tree/', SurveyTreeView.as_view()),
+    path('surveys/<int:pk>/tree/', SurveyTreeDetailView.as_view()),
+    path('surveys/<int:pk>/results/', SurveyResultsView.as_view()),
+    path('surveys/<int:pk>/export/', SurveyExportView.as_view()),
+    path('surveys/<int:pk>/questions/', read_view(QuestionsView.as_view())),
     path('surveys/<int:s_pk>/questions/<int:pk>/', QuestionDetailView.as_view()),
     path('surveys/<int:s_pk>/questions/<int:pk>/answers/', AnswersView.as_view()),
     path('surveys/<int:s_pk>/questions/<int:q_pk>/answers/<int:pk>/',
          AnswerDetailView.as_view()),
     path('customers/', CustomerView.as_view()),
     path('customers/<int:pk>/', CustomerDetailView.as_view()),
-    path('customers/<int:pk>/surveys/', CustomersComplSurveyView.as_view()),
+    path('customers/<int:pk>/surveys/', read_view(CustomersComplSurveyView.as_view())),
     path('customers/<int:c_pk>/surveys/<int:pk>/', CustComplSurvDetailView.as_view()),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0),
-            name='schema-json'),
+    path('customers/<int:pk>/history/', read_view(CustomerHistoryView.as_view())),
+    path('commits/<uuid:receipt>/', PendingCommitView.as_view()),
+    re_path(r'^swagger\.(?P<output>json|yaml)$', schema, name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0),
             name='schema-swagger-ui'),
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
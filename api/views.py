@@ -1,11 +1,94 @@
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import generics, mixins
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework import status
+import hashlib
+import math
+from django.conf import settings
+from django.db import router
+from django.db.models import Min, Prefetch, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from surveys.models import Survey, Question, Answer
+from surveys import cache as survey_cache
+from surveys.commits import payload_from_validated
+from surveys import archive, export
 from .serializers import *
+from .conditional import conditional, instance_validators, list_validators
+from .pagination import SurveyCursorPagination
+from .throttling import CustomerCommitThrottle, AddressCommitThrottle, GlobalCommitThrottle
+from .admission import AdmissionControlMixin
+from .idempotency import idempotent_response
+from SurveyProject.replicas import primary
+
+
+def active_surveys(now):
+    '''
+    Surveys relevant to the date: started and not finished, or without a
+    finish date.
+    '''
+    return Survey.objects.filter(
+        start_date__lte=now
+        ).filter(
+            Q(finish_date__gt=now) | Q(finish_date__isnull=True)
+            )
+
+
+def active_surveys_listing(request):
+    '''
+    Returns a page of active surveys for the request together with its
+    validators. Pages are cached until the next start or finish of a survey,
+    when the set of active surveys changes, or until any survey is changed.
+    Cached pages are read from the default database, never from a replica
+    which may lag behind.
+    '''
+    if hasattr(request, '_active_listing'):
+        return request._active_listing
+
+    path = request.build_absolute_uri()
+    version = survey_cache.get_active_listing_version()
+    listing = survey_cache.get_active_listing(path, version)
+    if listing is None:
+        now = timezone.now()
+        paginator = SurveyCursorPagination()
+        with primary():
+            page = paginator.paginate_queryset(active_surveys(now), request)
+            boundaries = Survey.objects.aggregate(
+                next_start=Min('start_date', filter=Q(start_date__gt=now)),
+                next_finish=Min('finish_date', filter=Q(finish_date__gt=now)))
+        serializer = SurveyReadSerializer(page, many=True)
+
+        digest = hashlib.md5(path.encode())
+        for survey in page:
+            digest.update(f'{survey.pk}-{survey.modified.timestamp()};'.encode())
+        listing = {
+            'document': paginator.get_paginated_response(serializer.data).data,
+            'etag': digest.hexdigest(),
+            'last_modified': max((survey.modified for survey in page), default=None),
+        }
+
+        next_boundary = min(filter(None, boundaries.values()), default=None)
+        timeout = settings.SURVEY_CACHE_TIMEOUT
+        if next_boundary is not None:
+            timeout = max(1, math.ceil((next_boundary - now).total_seconds()))
+        survey_cache.set_active_listing(path, version, listing, timeout)
+
+    request._active_listing = listing
+    return listing
+
+
+all_surveys_validators = list_validators(lambda request: Survey.objects.all(),
+                                         SurveyCursorPagination)
+
+
+def surveys_validators(request, *args, **kwargs):
+    if request.auth:
+        return all_surveys_validators(request)
+    listing = active_surveys_listing(request)
+    return listing['etag'], listing['last_modified']
 
 
 class SurveyView(generics.ListCreateAPIView):
@@ -13,24 +96,22 @@ class SurveyView(generics.ListCreateAPIView):
     queryset = Survey.objects.all()
     serializer_class = SurveySerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    pagination_class = SurveyCursorPagination
+    replica_reads = True
 
+    @conditional(surveys_validators)
     def list(self, request):
         '''
         Returns a list of surveys. For authenticated request all surveys,
-        for unauthenticated relevant to current date surveys.
-        Method GET.
+        for unauthenticated relevant to current date surveys, which are
+        served from the cache. Method GET.
         '''
         if request.auth:
-            queryset = self.get_queryset().order_by('-start_date')
-        else:
-            queryset = self.get_queryset().filter(
-                start_date__lte=timezone.now()
-                ).filter(
-                    finish_date__gt=timezone.now()
-                    ).order_by('-start_date')
+            page = self.paginate_queryset(self.get_queryset())
+            serializer = SurveyReadSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
 
-        serializer = SurveySerializer(queryset, many=True)
-        return Response(serializer.data)
+        return Response(active_surveys_listing(request)['document'])
 
     def create(self, request):
         '''
@@ -49,17 +130,29 @@ class SurveyDetailView(mixins.UpdateModelMixin,
                        generics.GenericAPIView):
     queryset = Survey.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    replica_reads = True
 
+    @conditional(instance_validators(Survey.objects.all()))
     def get(self, request, pk):
         '''
         Returns a detail view of a survey with nested jsons for each belonged
-        question with nested for all preset answers. Method GET.
-        '''
-        survey = get_object_or_404(self.get_queryset(), pk=pk)
-        questions_queryset = Question.objects.filter(survey=survey)
-        serializer = SurveyDetailSerializer(survey,
-                                            context={'questions': questions_queryset})
-        return Response(serializer.data)
+        question with nested for all preset answers. Rendered documents are
+        cached until the survey, its questions or answers change, they are
+        rendered from the default database. Method GET.
+        '''
+        version = survey_cache.get_version(pk)
+        document = survey_cache.get_document(pk, version)
+        if document is None:
+            with primary():
+                survey = get_object_or_404(self.get_queryset(), pk=pk)
+                questions_queryset = Question.objects.filter(
+                    survey=survey
+                    ).order_by('id').prefetch_related('answer_set')
+                serializer = SurveyDetailSerializer(survey,
+                                                    context={'questions': questions_queryset})
+                document = serializer.data
+            survey_cache.set_document(pk, version, document)
+        return Response(document)
 
     def put(self, request, pk):
         '''
@@ -80,20 +173,129 @@ class SurveyDetailView(mixins.UpdateModelMixin,
             return SurveySerializer
 
 
+def survey_tree_response(serializer, success_status):
+    '''
+    Writes a validated survey tree and returns the detail view of the survey.
+    '''
+    if serializer.is_valid():
+        survey = serializer.save()
+        questions_queryset = Question.objects.filter(
+            survey=survey
+            ).order_by('id').prefetch_related('answer_set')
+        serializer = SurveyDetailSerializer(survey,
+                                            context={'questions': questions_queryset})
+        return Response(serializer.data, status=success_status)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class SurveyTreeView(generics.GenericAPIView):
+    queryset = Survey.objects.all()
+    serializer_class = SurveyTreeSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        '''
+        Creates a survey with all its questions and their preset answers from
+        one nested document, written in one transaction. Returns the detail
+        view of the survey. Method POST. Token.
+        '''
+        serializer = SurveyTreeSerializer(data=request.data)
+        return survey_tree_response(serializer, status.HTTP_201_CREATED)
+
+
+class SurveyTreeDetailView(generics.GenericAPIView):
+    queryset = Survey.objects.all()
+    serializer_class = SurveyTreeSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def put(self, request, pk):
+        '''
+        Upserts a survey tree: the survey is edited, questions and answers with
+        `id` are edited, ones without `id` are created. Questions and answers
+        missing in the document are kept. Method PUT. Token.
+        '''
+        survey = get_object_or_404(self.get_queryset(), pk=pk)
+        serializer = SurveyTreeSerializer(survey, data=request.data)
+        return survey_tree_response(serializer, status.HTTP_200_OK)
+
+
+class SurveyResultsView(generics.GenericAPIView):
+    queryset = Survey.objects.all()
+    serializer_class = SurveyResultsSerializer
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+
+    def get(self, request, pk):
+        '''
+        Returns results of a survey: numbers of given answers for each question
+        and each preset answer. Method GET. Token.
+        '''
+        survey = get_object_or_404(self.get_queryset(), pk=pk)
+        questions_queryset = Question.objects.filter(
+            survey=survey
+            ).order_by('id').prefetch_related('answer_set')
+        stats_queryset = AnswerStat.objects.filter(question__survey=survey)
+        serializer = SurveyResultsSerializer(survey,
+                                             context={'questions': questions_queryset,
+                                                      'stats': stats_queryset})
+        return Response(serializer.data)
+
+
+class SurveyExportView(APIView):
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+
+    def get(self, request, pk):
+        '''
+        Streams all given answers of a survey as NDJSON or as CSV by `output`
+        query parameter. Commits can be limited by `since` and `until` dates
+        and by `customer`. Method GET. Token.
+        '''
+        survey = get_object_or_404(Survey.objects.all(), pk=pk)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            return Response({'output': f'Choose one of {", ".join(export.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for name in ('since', 'until'):
+            if name in request.query_params:
+                filters[name] = parse_datetime(request.query_params[name])
+                if filters[name] is None:
+                    return Response({name: 'Expected a date and time'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+        if 'customer' in request.query_params:
+            if not request.query_params['customer'].isdigit():
+                return Response({'customer': 'Expected a customer id'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            filters['customer'] = int(request.query_params['customer'])
+
+        # Rows are read while the response is streamed, after the request
+        # has left the view, so the database chosen for it is given explicitly.
+        rows = export.export_rows(survey, using=router.db_for_read(GivenAnswer), **filters)
+        response = StreamingHttpResponse(export.export_lines(output, rows),
+                                         content_type=export.CONTENT_TYPES[output])
+        response['Content-Disposition'] = (
+            f'attachment; filename="survey-{survey.pk}.{output}"')
+        return response
+
+
 class QuestionsView(generics.ListCreateAPIView):
 
     queryset = Question.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(list_validators(
+        lambda request, pk: Question.objects.filter(survey=pk)))
     def list(self, request, pk):
         '''
         Returns a list of questions belonged to the survey (pk). Method GET.
         '''
         survey = get_object_or_404(Survey.objects.all(), pk=pk)
-        queryset = self.get_queryset().filter(survey=survey)
+        page = self.paginate_queryset(self.get_queryset().filter(survey=survey))
 
-        serializer = QuestionSerializer(queryset, many=True)
-        return Response(serializer.data)
+        serializer = QuestionSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, pk):
         '''
@@ -121,12 +323,13 @@ class QuestionDetailView(mixins.UpdateModelMixin,
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
 
+    @conditional(instance_validators(Question.objects.all()))
     def get(self, request, s_pk, pk):
         '''
         Returns a detail view of a question. Method GET.
         '''
         question = get_object_or_404(self.queryset, pk=pk)
-        serializer = QuestionNestedSerializer(question, context={'question': question})
+        serializer = QuestionNestedSerializer(question)
         return Response(serializer.data)
 
     def put(self, request, s_pk, pk):
@@ -148,15 +351,17 @@ class AnswersView(generics.ListCreateAPIView):
     serializer_class = AnswerSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(list_validators(
+        lambda request, s_pk, pk: Answer.objects.filter(question=pk)))
     def list(self, request, s_pk, pk):
         '''
         Returns a list of answers belonged to the question (pk). Method GET.
         '''
         question = get_object_or_404(Question.objects.all(), pk=pk)
-        queryset = self.get_queryset().filter(question=question)
+        page = self.paginate_queryset(self.get_queryset().filter(question=question))
 
-        serializer = AnswerSerializer(queryset, many=True)
-        return Response(serializer.data)
+        serializer = AnswerReadSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, s_pk,  pk):
         '''
@@ -179,6 +384,7 @@ class AnswerDetailView(mixins.RetrieveModelMixin,
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
 
+    @conditional(instance_validators(Answer.objects.all()))
     def get(self, request, s_pk, q_pk, pk):
         '''
         Returns a detail view of an answer. Method GET.
@@ -208,9 +414,9 @@ class CustomerView(generics.ListCreateAPIView):
         '''
         Returns a list of customers. Method GET. Token.
         '''
-        queryset = self.get_queryset()
-        serializer = CustomerSerializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = CustomerSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request):
         '''
@@ -251,25 +457,44 @@ class CustomerDetailView(mixins.RetrieveModelMixin,
         return self.destroy(request, pk)
 
 
-class CustomersComplSurveyView(generics.GenericAPIView):
+class CustomersComplSurveyView(AdmissionControlMixin, generics.GenericAPIView):
     queryset = CompletedSurvey.objects.all()
+    throttle_classes = (CustomerCommitThrottle, AddressCommitThrottle, GlobalCommitThrottle)
 
     def get(self, request, pk):
         '''
-        Returns a list of customer's completed surveys. Method GET.
+        Returns a list of customer's completed surveys, archived ones
+        included. Method GET.
         '''
         customer = get_object_or_404(Customer.objects.all(), pk=pk)
-        queryset = self.get_queryset().filter(customer=customer)
-        serializer = CompletedSurveySerializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(archive.WithArchived(
+            self.get_queryset().filter(customer=customer).select_related('survey'),
+            ArchivedCompletedSurvey.objects.filter(customer=customer).select_related('survey')))
+        serializer = CompletedSurveySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def post(self, request, pk):
         '''
         Commits a completed survey, creates an instance of a completed surveys
-        and instances of all given answers. Method POST.
+        and instances of all given answers. In the queue commit mode a valid
+        commit is only queued and a receipt to look it up is returned. A
+        commit with an Idempotency-Key header is written once, retries with
+        the key get the first response. Method POST.
         '''
+        key = request.headers.get('Idempotency-Key')
+        if key is not None:
+            return idempotent_response(request, key, lambda: self.commit(request))
+        return self.commit(request)
+
+    def commit(self, request):
         serializer = SurveyCommitSerializer(data=request.data)
         if serializer.is_valid():
+            if settings.SURVEY_COMMIT_MODE == 'queue':
+                pending_commit = PendingCommit.objects.create(
+                    payload=payload_from_validated(serializer.validated_data))
+                serializer = PendingCommitSerializer(pending_commit)
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                                headers={'Location': f'/api/commits/{pending_commit.receipt}/'})
             commited_survey = serializer.save()
             serializer = SurveyCommitSerializer(commited_survey)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -289,10 +514,63 @@ class CustComplSurvDetailView(generics.GenericAPIView):
     def get(self, request, c_pk, pk):
         '''
         Returns a detail view for a completed survey with a list of given answers
-        belonged to that survey. Method GET.
-        '''
-        completed_survey = get_object_or_404(self.get_queryset(), pk=pk)
-        answers_queryset = GivenAnswer.objects.filter(completed_survey=completed_survey)
+        belonged to that survey. Archived completed surveys are read from the
+        archive. Method GET.
+        '''
+        try:
+            completed_survey = self.get_queryset().select_related('survey').get(pk=pk)
+        except CompletedSurvey.DoesNotExist:
+            completed_survey = get_object_or_404(ArchivedCompletedSurvey.objects.all(), pk=pk)
+            answers = archive.given_answers(completed_survey)
+        else:
+            answers = GivenAnswer.objects.filter(
+                completed_survey=completed_survey
+                ).select_related('question', 'choice')
         serializer = ComplSurvDetailSerializer(completed_survey,
-                                               context={'answers': answers_queryset})
+                                               context={'answers': answers})
         return Response(serializer.data)
+
+
+class CustomerHistoryView(generics.GenericAPIView):
+    queryset = CompletedSurvey.objects.all()
+    serializer_class = CompletedSurveyHistorySerializer
+    replica_reads = True
+
+    def get(self, request, pk):
+        '''
+        Returns a list of customer's completed surveys, archived ones
+        included, with all given answers embedded, read by a fixed number of
+        queries for any page. Completed surveys can be filtered by `survey`
+        query parameter. Method GET.
+        '''
+        customer = get_object_or_404(Customer.objects.all(), pk=pk)
+        filters = {'customer': customer}
+        if 'survey' in request.query_params:
+            if not request.query_params['survey'].isdigit():
+                return Response({'survey': 'Expected a survey id'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            filters['survey'] = int(request.query_params['survey'])
+
+        page = self.paginate_queryset(archive.WithArchived(
+            self.get_queryset().filter(**filters).select_related('survey').prefetch_related(
+                Prefetch('givenanswer_set',
+                         queryset=GivenAnswer.objects.select_related(
+                             'question', 'choice').order_by('id'))),
+            ArchivedCompletedSurvey.objects.filter(**filters).select_related('survey')))
+        archived_answers = archive.given_answers_of(
+            [each for each in page if isinstance(each, ArchivedCompletedSurvey)])
+        serializer = CompletedSurveyHistorySerializer(
+            page, many=True, context={'archived_answers': archived_answers})
+        return self.get_paginated_response(serializer.data)
+
+
+class PendingCommitView(generics.RetrieveAPIView):
+    queryset = PendingCommit.objects.all()
+    serializer_class = PendingCommitSerializer
+    lookup_field = 'receipt'
+
+    def get(self, request, receipt):
+        '''
+        Returns a status of a queued commit by its receipt. Method GET.
+        '''
+        return self.retrieve(request, receipt)
@@ -0,0 +1,28 @@
+'''
+Gunicorn settings of the production server, for example:
+
+~$ DJANGO_PROFILE=production gunicorn SurveyProject.wsgi
+
+Every worker process keeps its own persistent database connections, so the
+number of connections to the database is WEB_CONCURRENCY * WEB_THREADS.
+'''
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+threads = int(os.environ.get('WEB_THREADS', 1))
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+# Workers are restarted from time to time to bound memory growth.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+keepalive = 5
+
+accesslog = '-'
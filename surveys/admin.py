@@ -7,3 +7,7 @@ admin.site.register(Answer)
 admin.site.register(Customer)
 admin.site.register(CompletedSurvey)
 admin.site.register(GivenAnswer)
+admin.site.register(PendingCommit)
+admin.site.register(AnswerStat)
+admin.site.register(ArchivedCompletedSurvey)
+admin.site.register(IdempotencyKey)
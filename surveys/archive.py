@@ -0,0 +1,169 @@
+'''
+Archive tier for responses of closed surveys.
+
+Completed surveys of surveys finished before a date are moved in batches
+from CompletedSurvey and GivenAnswer into ArchivedCompletedSurvey, where all
+given answers of a completed survey are one zlib compressed JSON document.
+The hot tables then hold responses of live surveys only, archived responses
+are still read by the completed survey detail view, the export and the
+rebuild of answer statistics.
+'''
+import heapq
+import json
+import zlib
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from .models import (Question, Answer, CompletedSurvey, GivenAnswer,
+                     ArchivedCompletedSurvey)
+
+
+def pack(answers):
+    '''
+    Compresses (question, choice, answer) triples of given answers.
+    '''
+    return zlib.compress(json.dumps(answers, separators=(',', ':')).encode())
+
+
+def unpack(document):
+    return [tuple(each) for each in json.loads(zlib.decompress(document))]
+
+
+def archive_batch(before, batch_size):
+    '''
+    Moves one batch of completed surveys of surveys finished before the date
+    into the archive in one transaction. Returns the batch size.
+    '''
+    with transaction.atomic():
+        completed_surveys = list(CompletedSurvey.objects.filter(
+            survey__finish_date__lt=before
+            ).order_by('id')[:batch_size])
+        if not completed_surveys:
+            return 0
+
+        answers = defaultdict(list)
+        # Texts of chosen preset answers are kept, so archived answers
+        # survive deletion of the preset answers.
+        for completed_survey_id, question_id, choice_id, text in GivenAnswer.objects.filter(
+                completed_survey__in=completed_surveys
+                ).order_by('id').values_list('completed_survey', 'question', 'choice',
+                                             Coalesce('choice__text', 'answer')):
+            answers[completed_survey_id].append((question_id, choice_id, text))
+
+        ArchivedCompletedSurvey.objects.bulk_create(
+            [ArchivedCompletedSurvey(id=each.pk,
+                                     survey_id=each.survey_id,
+                                     customer_id=each.customer_id,
+                                     created=each.created,
+                                     answers=pack(answers[each.pk]))
+             for each in completed_surveys])
+        GivenAnswer.objects.filter(completed_survey__in=completed_surveys).delete()
+        CompletedSurvey.objects.filter(pk__in=[each.pk for each in completed_surveys]).delete()
+
+    return len(completed_surveys)
+
+
+def given_answers(archived):
+    '''
+    Returns unsaved given answers of an archived completed survey with their
+    questions and chosen preset answers, read by two queries.
+    '''
+    return given_answers_of([archived])[archived.pk]
+
+
+def given_answers_of(archived_surveys):
+    '''
+    Returns unsaved given answers of archived completed surveys by their ids,
+    with questions and chosen preset answers of all of them read by two
+    queries.
+    '''
+    answers = {archived.pk: unpack(archived.answers) for archived in archived_surveys}
+    triples = [triple for each in answers.values() for triple in each]
+    questions = Question.objects.in_bulk({question_id for question_id, choice_id, text
+                                          in triples} - {None})
+    choices = Answer.objects.in_bulk({choice_id for question_id, choice_id, text
+                                      in triples} - {None})
+    return {archived.pk: [GivenAnswer(completed_survey_id=archived.pk,
+                                      question=questions.get(question_id),
+                                      choice=choices.get(choice_id),
+                                      answer=text,
+                                      answered_at=archived.created)
+                          for question_id, choice_id, text in answers[archived.pk]]
+            for archived in archived_surveys}
+
+
+class WithArchived:
+    '''
+    Completed surveys together with archived ones, which keep their ids, for
+    cursor pagination by id. Ordering and filters are applied to both
+    querysets, a slice reads at most its end from each and merges them.
+    '''
+    def __init__(self, live, archived, descending=False):
+        self.live = live
+        self.archived = archived
+        self.descending = descending
+
+    def order_by(self, *fields):
+        if fields not in (('id',), ('-id',)):
+            raise ValueError('Completed surveys with archived ones are ordered by id only')
+        return WithArchived(self.live.order_by(*fields), self.archived.order_by(*fields),
+                            descending=fields == ('-id',))
+
+    def filter(self, *args, **kwargs):
+        return WithArchived(self.live.filter(*args, **kwargs),
+                            self.archived.filter(*args, **kwargs), self.descending)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.stop is None:
+            raise TypeError('Completed surveys with archived ones are read by bounded slices')
+        merged = heapq.merge(self.live[:index.stop], self.archived[:index.stop],
+                             key=lambda each: each.id, reverse=self.descending)
+        return list(merged)[index]
+
+
+def export_rows(survey, since=None, until=None, customer=None, chunk_size=2000,
+                using=None):
+    '''
+    Returns an iterator over archived given answers of the survey as rows of
+    the export, ordered by completed surveys.
+    '''
+    queryset = ArchivedCompletedSurvey.objects.using(using).filter(survey=survey)
+    if since is not None:
+        queryset = queryset.filter(created__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created__lt=until)
+    if customer is not None:
+        queryset = queryset.filter(customer=customer)
+
+    questions = dict(Question.objects.using(using).filter(
+        survey=survey).values_list('pk', 'text'))
+    choices = dict(Answer.objects.using(using).filter(
+        question__survey=survey).values_list('pk', 'text'))
+    for archived in queryset.order_by('id').iterator(chunk_size=chunk_size):
+        for question_id, choice_id, text in unpack(archived.answers):
+            if question_id not in questions:
+                continue
+            choice_id = choice_id if choice_id in choices else None
+            yield (archived.pk, archived.customer_id, archived.created,
+                   question_id, questions[question_id], choice_id,
+                   choices[choice_id] if choice_id is not None else text)
+
+
+def count_answers(questions):
+    '''
+    Counts archived given answers of the questions by question and chosen
+    preset answer, like the statistics count live given answers.
+    '''
+    surveys = set(questions.values_list('survey', flat=True))
+    questions = set(questions.values_list('pk', flat=True))
+    choices = set(Answer.objects.filter(question__in=questions).values_list('pk', flat=True))
+    keys = Counter()
+    for document in ArchivedCompletedSurvey.objects.filter(
+            survey__in=surveys
+            ).values_list('answers', flat=True).iterator():
+        for question_id, choice_id, text in unpack(document):
+            if question_id in questions:
+                keys[question_id, choice_id if choice_id in choices else None] += 1
+    return keys
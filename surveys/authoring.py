@@ -0,0 +1,62 @@
+'''
+Writing of whole survey trees, a survey with its questions and their preset
+answers, for the bulk authoring endpoint.
+'''
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Survey, Question, Answer
+from .signals import touch_survey
+
+
+def save_new(model, instances):
+    '''
+    Inserts instances with one bulk insert where the database returns primary
+    keys of bulk inserted rows, one by one otherwise.
+    '''
+    if connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(instances)
+    else:
+        for instance in instances:
+            instance.save()
+
+
+def write_survey_tree(survey, questions):
+    '''
+    Writes a survey and its questions given as pairs of a question and a list
+    of its preset answers. Instances with a primary key are updated, others
+    are inserted, each kind of rows by one bulk query in one transaction.
+    Questions and answers of the survey missing in the tree are kept.
+
+    Bulk queries send no signals, so the survey is marked as changed once
+    after everything is written.
+    '''
+    now = timezone.now()
+
+    with transaction.atomic():
+        survey.save()
+
+        for question, answers in questions:
+            question.survey = survey
+            question.modified = now
+        save_new(Question, [question for question, answers in questions
+                            if question.pk is None])
+        Question.objects.bulk_update([question for question, answers in questions
+                                      if question.pk is not None],
+                                     ['text', 'answer_type', 'modified'])
+
+        all_answers = []
+        for question, answers in questions:
+            for answer in answers:
+                answer.question = question
+                answer.modified = now
+                all_answers.append(answer)
+        Answer.objects.bulk_create([answer for answer in all_answers
+                                    if answer.pk is None])
+        Answer.objects.bulk_update([answer for answer in all_answers
+                                    if answer.pk is not None],
+                                   ['text', 'modified'])
+
+        touch_survey(survey.pk)
+
+    return survey
@@ -0,0 +1,130 @@
+'''
+Versioned cache for rendered survey documents.
+
+Every survey has a version key in the cache, documents are stored under a key
+containing the version they were rendered for. Writing to a survey, its
+questions or answers bumps the version once the write is committed, so stale
+documents are never read again and are left to the eviction of the cache
+backend.
+
+Validation plans of survey commits are versioned by the same survey version.
+
+Pages of the active surveys listing are versioned the same way by one version
+for all surveys and expire at the moment the set of active surveys changes.
+'''
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+ACTIVE_LISTING_VERSION_KEY = 'surveys:active:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = Lock()
+
+
+def get_cache():
+    return caches[settings.SURVEY_CACHE_ALIAS]
+
+
+def version_key(survey_id):
+    return f'survey:{survey_id}:version'
+
+
+def document_key(survey_id, version):
+    return f'survey:{survey_id}:document:{version}'
+
+
+def plan_key(survey_id, version):
+    return f'survey:{survey_id}:plan:{version}'
+
+
+def active_listing_key(path, version):
+    return f'surveys:active:{version}:{path}'
+
+
+def _current_version(key):
+    '''
+    Returns the version kept under the key. A lost version key is recreated
+    from the clock, so it never matches a document rendered before.
+    '''
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def _counted(document):
+    with _stats_lock:
+        _stats['hits' if document is not None else 'misses'] += 1
+    return document
+
+
+def get_version(survey_id):
+    '''
+    Returns the current version of the survey.
+    '''
+    return _current_version(version_key(survey_id))
+
+
+def bump_version(survey_id):
+    _bump_version(version_key(survey_id))
+
+
+def get_document(survey_id, version):
+    return _counted(get_cache().get(document_key(survey_id, version)))
+
+
+def set_document(survey_id, version, document):
+    get_cache().set(document_key(survey_id, version), document,
+                    timeout=settings.SURVEY_CACHE_TIMEOUT)
+
+
+def get_plan(survey_id, version):
+    return get_cache().get(plan_key(survey_id, version))
+
+
+def set_plan(survey_id, version, plan):
+    get_cache().set(plan_key(survey_id, version), plan,
+                    timeout=settings.SURVEY_CACHE_TIMEOUT)
+
+
+def get_active_listing_version():
+    return _current_version(ACTIVE_LISTING_VERSION_KEY)
+
+
+def bump_active_listing_version():
+    _bump_version(ACTIVE_LISTING_VERSION_KEY)
+
+
+def get_active_listing(path, version):
+    return _counted(get_cache().get(active_listing_key(path, version)))
+
+
+def set_active_listing(path, version, listing, timeout):
+    '''
+    Caches a page of the active surveys listing, at most for the cache timeout
+    of survey documents.
+    '''
+    get_cache().set(active_listing_key(path, version), listing,
+                    timeout=min(timeout, settings.SURVEY_CACHE_TIMEOUT))
+
+
+def stats():
+    '''
+    Returns hit and miss counters of the current process.
+    '''
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,153 @@
+'''
+Writing of survey commits, shared by the commit endpoint and the worker of
+the ingestion queue.
+'''
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from . import stats
+from .models import (Customer, Survey, Question, Answer, CompletedSurvey, GivenAnswer,
+                     PendingCommit)
+
+
+def write_commits(commits):
+    '''
+    Writes commits given as pairs of an unsaved completed survey and a list of
+    its unsaved given answers. All given answers are inserted by one bulk
+    insert, completed surveys too where the database returns primary keys of
+    bulk inserted rows. Answer statistics are counted in the same transaction.
+    With single commits per customer the database rejects a repeated commit
+    of a survey by IntegrityError.
+    '''
+    completed_surveys = [completed_survey for completed_survey, answers in commits]
+    if settings.SURVEY_SINGLE_COMMIT_PER_CUSTOMER:
+        for completed_survey in completed_surveys:
+            completed_survey.single = True
+    features = connections[router.db_for_write(CompletedSurvey)].features
+
+    with transaction.atomic():
+        if features.can_return_rows_from_bulk_insert:
+            CompletedSurvey.objects.bulk_create(completed_surveys)
+        else:
+            for completed_survey in completed_surveys:
+                completed_survey.save()
+
+        given_answers = []
+        for completed_survey, answers in commits:
+            for answer in answers:
+                answer.completed_survey = completed_survey
+                answer.answered_at = completed_survey.created
+                given_answers.append(answer)
+        GivenAnswer.objects.bulk_create(given_answers)
+        stats.count_given_answers(given_answers)
+
+    return completed_surveys
+
+
+def given_answer(data):
+    '''
+    Returns an unsaved given answer from its validated data. A chosen preset
+    answer is kept only as a reference, without a copy of its text.
+    '''
+    choice = data.get('choice')
+    return GivenAnswer(question_id=data['question'], choice_id=choice,
+                       answer='' if choice is not None else data['answer'])
+
+
+def payload_from_validated(validated_data):
+    '''
+    Returns a JSON payload of a validated commit to keep in the queue.
+    '''
+    return {
+        'customer': validated_data['customer'].pk,
+        'survey': validated_data['survey'] and validated_data['survey'].pk,
+        'given_answers': [{'question': each['question'], 'answer': each['answer'],
+                           'choice': each.get('choice')}
+                          for each in validated_data['given_answers']],
+    }
+
+
+def commit_from_payload(payload):
+    completed_survey = CompletedSurvey(customer_id=payload['customer'],
+                                       survey_id=payload['survey'])
+    answers = [given_answer(each) for each in payload['given_answers']]
+    return completed_survey, answers
+
+
+def drain_pending_commits(batch_size):
+    '''
+    Writes one batch of pending commits and marks them done in the same
+    transaction, so a batch interrupted by a failure is written again as a
+    whole and a written one is never taken again. Returns the batch size.
+
+    Objects deleted since a commit was queued are handled like deletion
+    handles existing commits: a missing survey or question is set to null,
+    a missing preset answer keeps the given text, a commit of a missing
+    customer fails. With single commits per customer
+    a repeated commit of a survey fails as well.
+    '''
+    features = connections[router.db_for_write(PendingCommit)].features
+
+    with transaction.atomic():
+        queryset = PendingCommit.objects.filter(status='pending').order_by('id')
+        if features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        pending = list(queryset[:batch_size])
+        if not pending:
+            return 0
+
+        payloads = [each.payload for each in pending]
+        customers = set(Customer.objects.filter(
+            pk__in={payload['customer'] for payload in payloads}
+            ).values_list('pk', flat=True))
+        surveys = set(Survey.objects.filter(
+            pk__in={payload['survey'] for payload in payloads}
+            ).values_list('pk', flat=True))
+        questions = set(Question.objects.filter(
+            pk__in={each['question'] for payload in payloads
+                    for each in payload['given_answers']}
+            ).values_list('pk', flat=True))
+        choices = set(Answer.objects.filter(
+            pk__in={each.get('choice') for payload in payloads
+                    for each in payload['given_answers']} - {None}
+            ).values_list('pk', flat=True))
+
+        committed = set()
+        if settings.SURVEY_SINGLE_COMMIT_PER_CUSTOMER:
+            committed = set(CompletedSurvey.objects.filter(
+                customer__in=customers,
+                survey__in=surveys
+                ).values_list('customer_id', 'survey_id'))
+
+        writable = []
+        for each in pending:
+            if each.payload['customer'] not in customers:
+                each.status = 'failed'
+                each.error = f'Customer {each.payload["customer"]} does not exist'
+                continue
+            if settings.SURVEY_SINGLE_COMMIT_PER_CUSTOMER:
+                if (each.payload['customer'], each.payload['survey']) in committed:
+                    each.status = 'failed'
+                    each.error = 'The survey is already committed by the customer'
+                    continue
+                committed.add((each.payload['customer'], each.payload['survey']))
+            completed_survey, answers = commit_from_payload(each.payload)
+            completed_survey.created = each.received
+            if completed_survey.survey_id not in surveys:
+                completed_survey.survey_id = None
+            for answer, data in zip(answers, each.payload['given_answers']):
+                if answer.question_id not in questions:
+                    answer.question_id = None
+                if answer.choice_id is not None and answer.choice_id not in choices:
+                    answer.choice_id = None
+                    answer.answer = data['answer']
+            writable.append((each, (completed_survey, answers)))
+
+        write_commits([commit for each, commit in writable])
+
+        for each, (completed_survey, answers) in writable:
+            each.status = 'done'
+            each.completed_survey = completed_survey
+        PendingCommit.objects.bulk_update(pending, ['status', 'completed_survey', 'error'])
+
+    return len(pending)
@@ -0,0 +1,79 @@
+'''
+Export of given answers of a survey as NDJSON or CSV lines. Rows are read by
+a server-side cursor in chunks, so an export of any size is produced with
+a flat memory footprint.
+'''
+import csv
+import heapq
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Coalesce
+
+from . import archive
+from .models import GivenAnswer
+
+
+FIELDS = ['completed_survey', 'customer', 'created', 'question', 'question_text', 'choice',
+          'answer']
+
+FORMATS = ['ndjson', 'csv']
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_rows(survey, since=None, until=None, customer=None, chunk_size=2000,
+                using=None):
+    '''
+    Returns an iterator over given answers of the survey as tuples ordered
+    like FIELDS, optionally limited by a commit date range and a customer.
+    Chosen preset answers are given by id and by text. Archived given answers
+    are merged in the order of completed surveys. Rows are read from the
+    `using` database, by default from the one routed for reads.
+    '''
+    queryset = GivenAnswer.objects.using(using).filter(completed_survey__survey=survey)
+    if since is not None:
+        queryset = queryset.filter(completed_survey__created__gte=since)
+    if until is not None:
+        queryset = queryset.filter(completed_survey__created__lt=until)
+    if customer is not None:
+        queryset = queryset.filter(completed_survey__customer=customer)
+
+    rows = queryset.order_by('completed_survey', 'id').annotate(
+        text=Coalesce('choice__text', 'answer')
+        ).values_list(
+            'completed_survey', 'completed_survey__customer', 'completed_survey__created',
+            'question', 'question__text', 'choice', 'text',
+            ).iterator(chunk_size=chunk_size)
+    archived_rows = archive.export_rows(survey, since, until, customer, chunk_size, using)
+    return heapq.merge(rows, archived_rows, key=lambda row: row[0])
+
+
+class Echo:
+    '''
+    File-like object for csv.writer returning written lines instead of
+    buffering them.
+    '''
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(FIELDS, row))) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_lines(output, rows):
+    if output == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows)
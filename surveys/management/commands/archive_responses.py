@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from surveys.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = ('Moves completed surveys and given answers of closed surveys into '
+            'compressed archive rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Archive surveys finished at least this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of completed surveys moved in one transaction.')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+
+        archived = 0
+        while True:
+            batch = archive_batch(before, options['batch_size'])
+            if not batch:
+                break
+            archived += batch
+            self.stdout.write(f'{batch} completed surveys archived')
+
+        self.stdout.write(self.style.SUCCESS(f'{archived} completed surveys archived in total'))
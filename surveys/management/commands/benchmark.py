@@ -0,0 +1,143 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from surveys.models import Survey, Customer, CompletedSurvey
+from surveys.validation import compile_plan
+
+
+class QueryCounter:
+    '''
+    Execute wrapper counting queries and their time without the overhead of
+    debug cursors.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks hot endpoints of the API in process and writes latency '
+            'percentiles, throughput, queries per request and peak memory to a '
+            'JSON file. Run generate_data first.')
+
+    scenarios = ['survey_detail', 'survey_list', 'survey_commit', 'completed_survey_detail']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests of each scenario.')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Requests made before measuring.')
+        parser.add_argument('--memory-requests', type=int, default=20,
+                            help='Requests traced to measure peak memory.')
+        parser.add_argument('--scenario', action='append', choices=self.scenarios,
+                            help='Scenario to run, all are run by default.')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='File to write results to.')
+
+    def handle(self, *args, **options):
+        survey = Survey.objects.filter(
+            completedsurvey__isnull=False).order_by('-pk').first()
+        if survey is None:
+            raise CommandError('No completed surveys found, run generate_data first')
+        completed_survey = CompletedSurvey.objects.filter(survey=survey).first()
+        given_answers = [{'question': pk, 'answer': min(options, default='Benchmark')}
+                         for pk, (answer_type, options, choices) in compile_plan(survey.pk).items()]
+        customer = Customer.objects.order_by('pk').first()
+
+        requests = {
+            'survey_detail': lambda client: client.get(f'/api/surveys/{survey.pk}/'),
+            'survey_list': lambda client: client.get('/api/surveys/'),
+            'survey_commit': lambda client: client.post(
+                f'/api/customers/{customer.pk}/surveys/',
+                {'customer': customer.pk,
+                 'survey': survey.pk,
+                 'given_answers': given_answers},
+                content_type='application/json'),
+            'completed_survey_detail': lambda client: client.get(
+                f'/api/customers/{completed_survey.customer_id}/surveys/{completed_survey.pk}/'),
+        }
+
+        results = {
+            'started': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'requests': options['requests'],
+            'scenarios': {},
+        }
+        for name in options['scenario'] or self.scenarios:
+            results['scenarios'][name] = self.run(requests[name], options)
+            self.report(name, results['scenarios'][name])
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def run(self, request, options):
+        client = Client()
+        for each in range(options['warmup']):
+            request(client)
+
+        latencies = []
+        queries = []
+        query_durations = []
+        statuses = set()
+        started = time.perf_counter()
+        for each in range(options['requests']):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = request(client)
+                latencies.append(time.perf_counter() - start)
+            queries.append(counter.count)
+            query_durations.append(counter.duration)
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - started
+
+        peak = 0
+        tracemalloc.start()
+        for each in range(options['memory_requests']):
+            tracemalloc.reset_peak()
+            request(client)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        return {
+            'statuses': sorted(statuses),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'requests_per_second': len(latencies) / elapsed,
+            'queries_per_request': statistics.mean(queries),
+            'query_ms_per_request': statistics.mean(query_durations) * 1000,
+            'peak_memory_kb': peak / 1024,
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name}: p50 {result["p50_ms"]:.2f} ms, p95 {result["p95_ms"]:.2f} ms, '
+            f'p99 {result["p99_ms"]:.2f} ms, {result["requests_per_second"]:.1f} rps, '
+            f'{result["queries_per_request"]:.1f} queries, '
+            f'{result["peak_memory_kb"]:.0f} KiB peak, statuses {result["statuses"]}')
@@ -0,0 +1,88 @@
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api import renderers
+from api.serializers import (SurveySerializer, SurveyReadSerializer, AnswerSerializer,
+                             AnswerReadSerializer, GivenAnswerSerializer,
+                             GivenAnswerReadSerializer)
+from surveys.models import Survey, Question, Answer, GivenAnswer
+
+
+def cpu_time_per_call(function, repeat):
+    start = time.process_time()
+    for each in range(repeat):
+        function()
+    return (time.process_time() - start) / repeat
+
+
+class Command(BaseCommand):
+    help = ('Measures CPU time per response of model serializers and the default '
+            'JSON renderer against read-only serializers and the fast renderer, '
+            'on unsaved instances without the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100,
+                            help='Instances in one response.')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Measured responses of each kind.')
+        parser.add_argument('--output', default='benchmark_serialization.json')
+
+    def handle(self, *args, **options):
+        items = options['items']
+        question = Question(id=1, text='Question', answer_type='uv')
+        instances = {
+            'survey': [Survey(id=index, title=f'Survey {index}', description='Description',
+                              start_date=datetime(2021, 9, 19), finish_date=None)
+                       for index in range(items)],
+            'answer': [Answer(id=index, text=f'Answer {index}', question=question)
+                       for index in range(items)],
+            'given_answer': [GivenAnswer(id=index, answer=f'Answer {index}', question=question)
+                             for index in range(items)],
+        }
+        serializers = {
+            'survey': (SurveySerializer, SurveyReadSerializer),
+            'answer': (AnswerSerializer, AnswerReadSerializer),
+            'given_answer': (GivenAnswerSerializer, GivenAnswerReadSerializer),
+        }
+        default_renderer = JSONRenderer()
+        fast_renderer = renderers.FastJSONRenderer()
+
+        results = {
+            'items': items,
+            'orjson': renderers.orjson is not None,
+            'resources': {},
+        }
+        for name, (model_serializer, read_serializer) in serializers.items():
+            data = model_serializer(instances[name], many=True).data
+            assert data == read_serializer(instances[name], many=True).data
+
+            timings = {
+                'model_serializer_us': cpu_time_per_call(
+                    lambda: model_serializer(instances[name], many=True).data,
+                    options['repeat']),
+                'read_serializer_us': cpu_time_per_call(
+                    lambda: read_serializer(instances[name], many=True).data,
+                    options['repeat']),
+                'default_renderer_us': cpu_time_per_call(
+                    lambda: default_renderer.render(data), options['repeat']),
+                'fast_renderer_us': cpu_time_per_call(
+                    lambda: fast_renderer.render(data), options['repeat']),
+            }
+            timings = {key: value * 1000000 for key, value in timings.items()}
+            before = timings['model_serializer_us'] + timings['default_renderer_us']
+            after = timings['read_serializer_us'] + timings['fast_renderer_us']
+            timings['saved_us'] = before - after
+            timings['saved_percent'] = 100 * (before - after) / before
+            results['resources'][name] = timings
+
+            self.stdout.write(
+                f'{name}: {before:.0f} us -> {after:.0f} us per response of {items}, '
+                f'{timings["saved_percent"]:.0f}% saved')
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from surveys.commits import drain_pending_commits
+from surveys.models import PendingCommit
+
+
+class Command(BaseCommand):
+    help = 'Writes queued survey commits into completed surveys and given answers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of commits written in one transaction.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait for new commits in the loop mode.')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Queue failed commits again before draining.')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = PendingCommit.objects.filter(status='failed').update(status='pending',
+                                                                           error='')
+            self.stdout.write(f'{retried} failed commits queued again')
+
+        written = 0
+        while True:
+            batch = drain_pending_commits(options['batch_size'])
+            written += batch
+            if batch:
+                self.stdout.write(f'{batch} commits written')
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'{written} commits written in total'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from surveys.export import FORMATS, export_lines, export_rows
+from surveys.models import Survey
+
+
+def datetime_argument(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Exports all given answers of a survey as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey', type=int, help='Id of the survey to export.')
+        parser.add_argument('--output-format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--since', type=datetime_argument,
+                            help='Only commits made at this time or later.')
+        parser.add_argument('--until', type=datetime_argument,
+                            help='Only commits made before this time.')
+        parser.add_argument('--customer', type=int, help='Only commits of this customer.')
+        parser.add_argument('--file', help='File to write instead of the standard output.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not Survey.objects.filter(pk=options['survey']).exists():
+            raise CommandError(f'Survey {options["survey"]} does not exist')
+
+        rows = export_rows(options['survey'], options['since'], options['until'],
+                           options['customer'], options['chunk_size'])
+        lines = export_lines(options['output_format'], rows)
+
+        if options['file']:
+            with open(options['file'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,90 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from surveys import cache
+from surveys.commits import write_commits, given_answer
+from surveys.models import Survey, Question, Answer, Customer, CompletedSurvey
+
+
+class Command(BaseCommand):
+    help = ('Generates surveys with questions and preset answers, customers and '
+            'completed surveys to benchmark the API with.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--surveys', type=int, default=10)
+        parser.add_argument('--questions', type=int, default=20,
+                            help='Questions in each survey.')
+        parser.add_argument('--answers', type=int, default=4,
+                            help='Preset answers of each choice question.')
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--completed', type=int, default=100,
+                            help='Completed surveys of each survey.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Completed surveys written in one transaction.')
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        now = timezone.now()
+
+        first_customer = Customer.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        Customer.objects.bulk_create(
+            [Customer(name=f'Customer {number}') for number in range(options['customers'])],
+            batch_size=1000)
+        customers = list(Customer.objects.filter(
+            pk__gt=first_customer).values_list('pk', flat=True))
+
+        for number in range(options['surveys']):
+            survey = Survey.objects.create(
+                title=f'Generated survey {number}',
+                start_date=now - timedelta(days=generator.randint(0, 30)),
+                finish_date=(now + timedelta(days=generator.randint(1, 30))
+                             if number % 2 else None),
+                description='A survey generated for benchmarks')
+            Question.objects.bulk_create(
+                [Question(survey=survey,
+                          text=f'Question {index}',
+                          answer_type=('ta', 'uv', 'sv')[index % 3])
+                 for index in range(options['questions'])],
+                batch_size=1000)
+            questions = list(Question.objects.filter(survey=survey).order_by('pk'))
+            Answer.objects.bulk_create(
+                [Answer(question=question, text=f'Answer {index}')
+                 for question in questions if question.answer_type != 'ta'
+                 for index in range(options['answers'])],
+                batch_size=1000)
+            options_texts = [f'Answer {index}' for index in range(options['answers'])]
+            choices = {(question_id, text): pk for question_id, text, pk in Answer.objects.filter(
+                question__survey=survey).values_list('question_id', 'text', 'pk')}
+
+            commits = []
+            for index in range(options['completed']):
+                commits.append((
+                    CompletedSurvey(survey=survey,
+                                    customer_id=generator.choice(customers),
+                                    created=now - timedelta(
+                                        seconds=generator.randint(0, 30 * 24 * 3600))),
+                    [given_answer({'question': question.pk, 'answer': text,
+                                   'choice': choices.get((question.pk, text))})
+                     for question in questions
+                     for text in self.given_texts(generator, question, options_texts)]))
+                if len(commits) == options['batch_size']:
+                    write_commits(commits)
+                    commits = []
+            write_commits(commits)
+
+            self.stdout.write(f'Survey {survey.pk} generated')
+
+        cache.bump_active_listing_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["surveys"]} surveys and {len(customers)} customers generated'))
+
+    def given_texts(self, generator, question, options_texts):
+        if question.answer_type == 'ta' or not options_texts:
+            return [f'Text answer {generator.randint(0, 1000)}']
+        if question.answer_type == 'uv':
+            return [generator.choice(options_texts)]
+        return generator.sample(options_texts, generator.randint(1, len(options_texts)))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema import SCHEMA_PATH, generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Generates the OpenAPI schema served by the API into api/openapi.json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only fail when the committed schema differs from the code.')
+
+    def handle(self, *args, **options):
+        content = generate_schema()
+        if options['check']:
+            if not SCHEMA_PATH.exists() or SCHEMA_PATH.read_bytes() != content:
+                raise CommandError(f'{SCHEMA_PATH} is out of date, run generate_schema')
+            self.stdout.write(self.style.SUCCESS(f'{SCHEMA_PATH} is up to date'))
+            return
+
+        SCHEMA_PATH.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f'Schema written to {SCHEMA_PATH}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired idempotency keys of survey commits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of keys deleted by one query.')
+
+    def handle(self, *args, **options):
+        purged = 0
+        while True:
+            batch = purge_expired(options['batch_size'])
+            if not batch:
+                break
+            purged += batch
+
+        self.stdout.write(self.style.SUCCESS(f'{purged} expired idempotency keys deleted'))
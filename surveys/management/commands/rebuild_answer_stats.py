@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys import stats
+from surveys.models import Survey
+
+
+class Command(BaseCommand):
+    help = 'Recounts answer statistics of surveys from given answers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int,
+                            help='Id of the only survey to recount.')
+
+    def handle(self, *args, **options):
+        survey = None
+        if options['survey'] is not None:
+            survey = Survey.objects.filter(pk=options['survey']).first()
+            if survey is None:
+                raise CommandError(f'Survey {options["survey"]} does not exist')
+
+        stats.rebuild(survey)
+        self.stdout.write(self.style.SUCCESS('Answer statistics rebuilt'))
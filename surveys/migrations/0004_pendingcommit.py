@@ -0,0 +1,31 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0003_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCommit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=7)),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('error', models.TextField(blank=True)),
+                ('completed_survey', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='surveys.completedsurvey')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pendingcommit',
+            index=models.Index(fields=['status', 'id'], name='surveys_pen_status_802292_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0004_pendingcommit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('answer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveys.answer')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='answerstat',
+            constraint=models.UniqueConstraint(fields=('question', 'answer'), name='unique_answer_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='answerstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('answer__isnull', True)), fields=('question',), name='unique_unmatched_answer_stat'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0005_answerstat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'id'], name='surveys_ans_questio_a7bfab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedsurvey',
+            index=models.Index(fields=['customer', 'id'], name='surveys_com_custome_d3b42b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['survey', 'id'], name='surveys_que_survey__794d24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['-start_date', 'id'], name='surveys_sur_start_d_94e9cf_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0006_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedsurvey',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
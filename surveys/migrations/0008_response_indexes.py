@@ -0,0 +1,66 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:56
+
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery
+import django.utils.timezone
+import surveys.operations
+
+
+# Given answers updated by one statement of the backfill.
+BATCH_SIZE = 10000
+
+
+def copy_answered_at(apps, schema_editor):
+    '''
+    Copies creation times of completed surveys into their given answers in
+    ranges of primary keys. The migration is non-atomic, so each range is
+    committed by itself and locks only its own rows for a short time.
+    '''
+    CompletedSurvey = apps.get_model('surveys', 'CompletedSurvey')
+    GivenAnswer = apps.get_model('surveys', 'GivenAnswer')
+    bounds = GivenAnswer.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        GivenAnswer.objects.filter(
+            pk__gte=start, pk__lt=start + BATCH_SIZE
+            ).update(answered_at=Subquery(
+                CompletedSurvey.objects.filter(
+                    pk=OuterRef('completed_survey')
+                    ).values('created')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    # Given answers are updated in batches committed one by one and indexes
+    # are created concurrently on PostgreSQL, both outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0007_completedsurvey_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='givenanswer',
+            name='answered_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_answered_at, migrations.RunPython.noop),
+        surveys.operations.AddIndexConcurrently(
+            model_name='completedsurvey',
+            index=models.Index(fields=['survey', 'created'], name='surveys_com_survey__613e18_idx'),
+        ),
+        surveys.operations.AddIndexConcurrently(
+            model_name='completedsurvey',
+            index=models.Index(fields=['customer', 'survey'], name='surveys_com_custome_dd365c_idx'),
+        ),
+        surveys.operations.AddIndexConcurrently(
+            model_name='givenanswer',
+            index=models.Index(fields=['completed_survey', 'question'], name='surveys_giv_complet_2ebfbe_idx'),
+        ),
+        surveys.operations.AddIndexConcurrently(
+            model_name='givenanswer',
+            index=models.Index(fields=['question', 'answered_at'], name='surveys_giv_questio_2a7f33_idx'),
+        ),
+    ]
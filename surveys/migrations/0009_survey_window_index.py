@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0008_response_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['finish_date', 'start_date'], name='surveys_sur_finish__771752_idx'),
+        ),
+    ]
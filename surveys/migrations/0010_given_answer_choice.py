@@ -0,0 +1,76 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from django.db.models import Exists, Max, Min, OuterRef, Subquery
+import django.db.models.deletion
+import surveys.operations
+
+
+# Given answers updated by one statement of the conversion.
+BATCH_SIZE = 10000
+
+
+def pk_ranges(GivenAnswer):
+    bounds = GivenAnswer.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def reference_choices(apps, schema_editor):
+    '''
+    Replaces copied texts of preset answers by references in ranges of
+    primary keys. The migration is non-atomic, so each range is committed by
+    itself and locks only its own rows for a short time. Texts repeated by
+    several preset answers of a question refer to the first of them.
+    '''
+    Answer = apps.get_model('surveys', 'Answer')
+    GivenAnswer = apps.get_model('surveys', 'GivenAnswer')
+    choices = Answer.objects.filter(
+        question=OuterRef('question'), text=OuterRef('answer')
+        ).exclude(question__answer_type='ta').order_by('pk')
+    for start, stop in pk_ranges(GivenAnswer):
+        GivenAnswer.objects.filter(
+            Exists(choices), pk__gte=start, pk__lt=stop, choice__isnull=True
+            ).update(choice=Subquery(choices.values('pk')[:1]), answer='')
+
+
+def copy_choice_texts(apps, schema_editor):
+    Answer = apps.get_model('surveys', 'Answer')
+    GivenAnswer = apps.get_model('surveys', 'GivenAnswer')
+    for start, stop in pk_ranges(GivenAnswer):
+        GivenAnswer.objects.filter(
+            pk__gte=start, pk__lt=stop, choice__isnull=False
+            ).update(answer=Subquery(
+                Answer.objects.filter(pk=OuterRef('choice')).values('text')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    # Given answers are updated in ranges of primary keys committed one by
+    # one and the index is created concurrently on PostgreSQL, both outside
+    # a transaction.
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0009_survey_window_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='givenanswer',
+            name='choice',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='surveys.answer'),
+        ),
+        migrations.AlterField(
+            model_name='givenanswer',
+            name='answer',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(reference_choices, copy_choice_texts),
+        surveys.operations.AddIndexConcurrently(
+            model_name='givenanswer',
+            index=models.Index(fields=['choice'], name='surveys_giv_choice__691ad8_idx'),
+        ),
+    ]
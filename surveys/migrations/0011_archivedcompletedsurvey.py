@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0010_given_answer_choice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCompletedSurvey',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField()),
+                ('answers', models.BinaryField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.customer')),
+                ('survey', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='surveys.survey')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedcompletedsurvey',
+            index=models.Index(fields=['survey', 'id'], name='surveys_arc_survey__f0d185_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcompletedsurvey',
+            index=models.Index(fields=['customer', 'id'], name='surveys_arc_custome_16ce8f_idx'),
+        ),
+    ]
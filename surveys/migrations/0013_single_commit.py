@@ -0,0 +1,27 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:33
+
+from django.db import migrations, models
+import surveys.operations
+
+
+class Migration(migrations.Migration):
+
+    # The unique index is created concurrently on PostgreSQL, which is not
+    # allowed inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0012_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedsurvey',
+            name='single',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+        surveys.operations.AddConstraintConcurrently(
+            model_name='completedsurvey',
+            constraint=models.UniqueConstraint(condition=models.Q(('single', True)), fields=('customer', 'survey'), name='unique_single_commit'),
+        ),
+    ]
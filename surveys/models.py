@@ -1,4 +1,7 @@
+import uuid
+
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 
@@ -11,6 +14,13 @@ class Survey(models.Model):
                                        null=True,
                                        help_text='For example: 2021-08-28 00:43:35')
     description = models.TextField()
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-start_date', 'id']),
+            models.Index(fields=['finish_date', 'start_date']),
+        ]
 
     def __str__(self):
         return self.title
@@ -30,6 +40,10 @@ class Question(models.Model):
         max_length=2,
         choices=ANSWER_TYPE_CHOICES,
         default='ta')
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['survey', 'id'])]
 
     def __str__(self):
         return self.text
@@ -39,6 +53,10 @@ class Answer(models.Model):
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     text = models.TextField(blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['question', 'id'])]
 
     def __str__(self):
         return self.text
@@ -56,16 +74,148 @@ class CompletedSurvey(models.Model):
 
     survey = models.ForeignKey(Survey, on_delete=models.SET_NULL, null=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now)
+    # Set for commits written with SURVEY_SINGLE_COMMIT_PER_CUSTOMER, which
+    # the database then keeps unique per customer and survey.
+    single = models.BooleanField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'id']),
+            models.Index(fields=['survey', 'created']),
+            models.Index(fields=['customer', 'survey']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'survey'],
+                                    condition=models.Q(single=True),
+                                    name='unique_single_commit'),
+        ]
 
     def __str__(self):
         return str(self.pk)
 
 
 class GivenAnswer(models.Model):
-
+    '''
+    One given answer of a completed survey. A chosen preset answer is kept as
+    a reference in `choice`, one row for each chosen preset answer, and the
+    text is kept only for text answers and answers matching no preset answer.
+    The text of a deleted preset answer is copied into given answers choosing
+    it by surveys.signals.
+    '''
     completed_survey = models.ForeignKey(CompletedSurvey, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE, null=True)
-    answer = models.TextField() # Declarate a necessary copying for a text of an answer
+    # Indexed by Meta.indexes, so the index is created concurrently
+    choice = models.ForeignKey(Answer, on_delete=models.SET_NULL, null=True, blank=True,
+                               db_index=False)
+    answer = models.TextField(blank=True)
+    answered_at = models.DateTimeField(default=timezone.now) # A copy of completed_survey.created
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['completed_survey', 'question']),
+            models.Index(fields=['question', 'answered_at']),
+            models.Index(fields=['choice']),
+        ]
+
+    @property
+    def text(self):
+        return self.choice.text if self.choice_id else self.answer
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedCompletedSurvey(models.Model):
+    '''
+    Completed survey of a closed survey moved out of CompletedSurvey and
+    GivenAnswer by the archive command. It keeps the id of the completed
+    survey, its given answers are kept in one compressed document of
+    (question, choice, answer) triples.
+    '''
+    id = models.BigIntegerField(primary_key=True)
+    survey = models.ForeignKey(Survey, on_delete=models.SET_NULL, null=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    created = models.DateTimeField()
+    answers = models.BinaryField()
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['survey', 'id']),
+            models.Index(fields=['customer', 'id']),
+        ]
 
     def __str__(self):
-        return self.answer
+        return str(self.pk)
+
+
+class AnswerStat(models.Model):
+    '''
+    Number of given answers per question and preset answer, maintained while
+    commits are written. Given answers not matching any preset answer, and all
+    text answers, are counted in the row without a preset answer.
+    '''
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    answer = models.ForeignKey(Answer, on_delete=models.CASCADE, null=True, blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'answer'],
+                                    name='unique_answer_stat'),
+            models.UniqueConstraint(fields=['question'],
+                                    condition=models.Q(answer__isnull=True),
+                                    name='unique_unmatched_answer_stat'),
+        ]
+
+    def __str__(self):
+        return f'{self.question_id}: {self.answer_id} - {self.count}'
+
+
+class PendingCommit(models.Model):
+    '''
+    Validated survey commit waiting in the ingestion queue until a worker
+    writes it into CompletedSurvey and GivenAnswer.
+    '''
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    payload = models.JSONField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='pending')
+    received = models.DateTimeField(auto_now_add=True)
+    completed_survey = models.OneToOneField(CompletedSurvey,
+                                            on_delete=models.SET_NULL,
+                                            null=True,
+                                            blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return str(self.receipt)
+
+
+class IdempotencyKey(models.Model):
+    '''
+    Response to a survey commit sent with an Idempotency-Key header, replayed
+    for retries of the commit with the same key until it expires. The row is
+    written in the transaction of the commit, a concurrent retry waits on the
+    unique key and then replays the stored response.
+    '''
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    headers = models.JSONField(default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
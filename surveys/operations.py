@@ -0,0 +1,65 @@
+'''
+Migration operations for large tables.
+'''
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    '''
+    Adds an index without blocking writes to the table on PostgreSQL, where it
+    is created concurrently, other databases create it as usual. Migrations
+    using it have to be non-atomic.
+    '''
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+    def describe(self):
+        return 'Concurrently create index %s on field(s) %s of model %s' % (
+            self.index.name,
+            ', '.join(self.index.fields),
+            self.model_name,
+        )
+
+
+class AddConstraintConcurrently(migrations.AddConstraint):
+    '''
+    Adds a unique constraint with a condition, kept by PostgreSQL as a partial
+    unique index, without blocking writes to the table on PostgreSQL, where
+    the index is created concurrently. Migrations using it have to be
+    non-atomic.
+    '''
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            statement = self.constraint.create_sql(model, schema_editor)
+            statement.template = statement.template.replace(
+                'CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX CONCURRENTLY', 1)
+            schema_editor.execute(statement)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(schema_editor._delete_index_sql(
+                model, self.constraint.name, concurrently=True))
+
+    def describe(self):
+        return 'Concurrently create constraint %s on model %s' % (
+            self.constraint.name,
+            self.model_name,
+        )
+
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache
+from .models import Survey, Question, Answer, GivenAnswer
+
+
+def touch_survey(survey_id):
+    '''
+    Marks the survey as changed after a write to one of its questions or
+    answers, so its version and modification time cover the whole tree.
+
+    Versions are bumped once the transaction of the write commits, a document
+    or validation plan read before would otherwise be cached under the new
+    version and served after the commit.
+    '''
+    Survey.objects.filter(pk=survey_id).update(modified=timezone.now())
+    transaction.on_commit(lambda: cache.bump_version(survey_id))
+
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_changed(sender, instance, **kwargs):
+    survey_id = instance.pk
+
+    def bump_versions():
+        cache.bump_version(survey_id)
+        cache.bump_active_listing_version()
+    transaction.on_commit(bump_versions)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    touch_survey(instance.survey_id)
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def answer_changed(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id).update(modified=timezone.now())
+    survey_id = Question.objects.filter(
+        pk=instance.question_id
+        ).values_list('survey_id', flat=True).first()
+    if survey_id is not None:
+        touch_survey(survey_id)
+
+
+@receiver(pre_delete, sender=Answer)
+def answer_deleted(sender, instance, **kwargs):
+    '''
+    Copies the text of a deleted preset answer into given answers choosing
+    it, before their reference is set to null. Sent for bulk deletes too.
+    '''
+    GivenAnswer.objects.filter(choice=instance).update(answer=instance.text)
+
@@ -0,0 +1,62 @@
+'''
+Maintenance of the per-question answer statistics kept in AnswerStat.
+'''
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+
+from . import archive
+from .models import AnswerStat, GivenAnswer, Question
+
+
+def count_given_answers(given_answers):
+    '''
+    Adds given answers to the statistics with a constant number of queries:
+    missing rows are inserted, then all counters are raised by one update.
+    Given answers are counted by their chosen preset answer, text answers and
+    answers matching no preset answer have none.
+    '''
+    keys = Counter((answer.question_id, answer.choice_id) for answer in given_answers
+                   if answer.question_id is not None)
+    if not keys:
+        return
+
+    with transaction.atomic():
+        AnswerStat.objects.bulk_create(
+            [AnswerStat(question_id=question_id, answer_id=answer_id)
+             for question_id, answer_id in keys],
+            ignore_conflicts=True)
+        stats = AnswerStat.objects.filter(
+            question__in={question_id for question_id, answer_id in keys}
+            ).values_list('question_id', 'answer_id', 'pk')
+        increments = {pk: keys[question_id, answer_id]
+                      for question_id, answer_id, pk in stats
+                      if (question_id, answer_id) in keys}
+        AnswerStat.objects.filter(pk__in=increments).update(count=F('count') + Case(
+            *[When(pk=pk, then=Value(count)) for pk, count in increments.items()],
+            default=Value(0)))
+
+
+def rebuild(survey=None):
+    '''
+    Recounts the statistics from given answers, of one survey or of all, by
+    one aggregation over ids of questions and chosen preset answers. Archived
+    given answers are counted as well.
+    '''
+    questions = Question.objects.all()
+    if survey is not None:
+        questions = questions.filter(survey=survey)
+
+    with transaction.atomic():
+        keys = archive.count_answers(questions)
+        for row in GivenAnswer.objects.filter(
+                question__in=questions
+                ).values('question', 'choice').annotate(count=Count('id')).order_by():
+            keys[row['question'], row['choice']] += row['count']
+
+        AnswerStat.objects.filter(question__in=questions).delete()
+        AnswerStat.objects.bulk_create(
+            [AnswerStat(question_id=question_id, answer_id=answer_id, count=count)
+             for (question_id, answer_id), count in keys.items()],
+            batch_size=1000)
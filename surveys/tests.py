@@ -1,17 +1,48 @@
 '''
 Providing simple tests for basic operations with surveys: creating and commiting.
 '''
-from .models import Survey, Question, CompletedSurvey, GivenAnswer, Customer
+from . import cache as survey_cache
+from .models import (Survey, Question, Answer, CompletedSurvey, GivenAnswer, Customer,
+                     ArchivedCompletedSurvey, IdempotencyKey)
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO, BytesIO
+from datetime import timedelta
+from django.utils import timezone
+import json
+import asyncio
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from api.async_views import pooled_view
+from api.views import SurveyDetailView
+from api.serializers import SurveyCommitSerializer
+from api.authentication import token_cache
+from SurveyProject import replicas
+from django.db import router
+from django.http import HttpResponse
+from api import renderers, schema, throttling
+from api.admission import admission_controller
+from unittest import mock
+import os
+import tempfile
+import time
+from django.core.handlers.base import BaseHandler
+from django.urls import path
+from django.core.exceptions import ImproperlyConfigured
 
 
 class SurveyTests(APITestCase):
 
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username='spam', email='user@foo.com', password='top_secret')
         self.client = APIClient()
@@ -71,3 +102,1130 @@ class SurveyTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(CompletedSurvey.objects.get().customer.id, 1)
         self.assertEqual(GivenAnswer.objects.get().answer, "Answer")
+
+
+class SurveyDetailQueriesTests(APITestCase):
+
+
+    def setUp(self):
+        cache.clear()
+
+    def create_survey(self, questions_count):
+        survey = Survey.objects.create(
+                                       title="Test survey for detail",
+                                       start_date="2021-09-19T00:00:00",
+                                       finish_date="2021-10-30T00:00:00",
+                                       description="A survey for testing detail",
+                                       )
+        Question.objects.bulk_create(
+            Question(text=f"Question {i}", answer_type="uv", survey=survey)
+            for i in range(questions_count))
+        Answer.objects.bulk_create(
+            Answer(text=text, question=question)
+            for question in Question.objects.filter(survey=survey)
+            for text in ("Yes", "No"))
+        return survey
+
+
+    def test_detail_constant_queries(self):
+        """
+        Ensure the survey detail is built with the same number of queries
+        however many questions and answers the survey has.
+        """
+        for questions_count in (1, 50, 500):
+            survey = self.create_survey(questions_count)
+            with self.assertNumQueries(4):
+                response = self.client.get(f'/api/surveys/{survey.pk}/')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['questions']), questions_count)
+            self.assertEqual(len(response.data['questions'][1]['answers']), 2)
+
+
+    def test_detail_cached_until_changed(self):
+        """
+        Ensure a rendered survey is served from the cache, only its validators
+        are read from the database, and it is rendered again
+        after one of its answers is changed.
+        """
+        survey = self.create_survey(2)
+        url = f'/api/surveys/{survey.pk}/'
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['questions'][1]['answers'][0]['text'], "Yes")
+
+        answer = Answer.objects.filter(question__survey=survey).order_by('id').first()
+        answer.text = "Sure"
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['questions'][1]['answers'][0]['text'], "Sure")
+
+
+    def test_version_bumped_on_commit(self):
+        """
+        Ensure a survey is invalidated only once a write to it commits, so a
+        document read before the commit is not cached as the new version.
+        """
+        survey = self.create_survey(1)
+        version = survey_cache.get_version(survey.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.filter(question__survey=survey).first().save()
+            self.assertEqual(survey_cache.get_version(survey.pk), version)
+        self.assertNotEqual(survey_cache.get_version(survey.pk), version)
+
+
+    def test_detail_not_modified(self):
+        """
+        Ensure an unchanged survey is answered with 304 for a known ETag and
+        with a new body once one of its questions is changed.
+        """
+        survey = self.create_survey(2)
+        url = f'/api/surveys/{survey.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        question = Question.objects.filter(survey=survey).first()
+        question.text = "Changed"
+        question.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SurveyTreeTests(APITestCase):
+
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='spam', email='user@foo.com', password='top_secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.tree = {
+            "title": "Test survey",
+            "start_date": "2021-09-19T00:00:00",
+            "finish_date": None,
+            "description": "A survey for testing authoring",
+            "questions": [
+                {"text": "Name", "answer_type": "ta"},
+                {"text": "Colour", "answer_type": "uv",
+                 "answers": [{"text": "Red"}, {"text": "Blue"}]},
+            ],
+        }
+
+
+    def test_create_survey_tree(self):
+        """
+        Ensure a whole survey tree is created by one request.
+        """
+        response = self.client.post('/api/surveys/tree/', self.tree, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['questions'][2]['text'], 'Colour')
+        self.assertEqual([answer['text'] for answer in response.data['questions'][2]['answers']],
+                         ['Red', 'Blue'])
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Answer.objects.count(), 2)
+
+
+    def test_upsert_survey_tree(self):
+        """
+        Ensure an edited tree updates listed objects, adds new ones and
+        refreshes the cached survey document.
+        """
+        created = self.client.post('/api/surveys/tree/', self.tree, format='json').data
+        survey_url = f'/api/surveys/{created["id"]}/'
+        self.client.get(survey_url)
+
+        colour = created['questions'][2]
+        tree = dict(self.tree, title='Edited survey', questions=[
+            {"id": colour['id'], "text": "Favourite colour", "answer_type": "uv",
+             "answers": [{"id": colour['answers'][0]['id'], "text": "Green"},
+                         {"text": "Black"}]},
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/surveys/{created["id"]}/tree/', tree,
+                                       format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Answer.objects.count(), 3)
+        document = self.client.get(survey_url).data
+        self.assertEqual(document['title'], 'Edited survey')
+        self.assertEqual(document['questions'][2]['text'], 'Favourite colour')
+        self.assertEqual([answer['text'] for answer in document['questions'][2]['answers']],
+                         ['Green', 'Blue', 'Black'])
+
+
+    def test_invalid_survey_tree(self):
+        """
+        Ensure an invalid tree or foreign ids write nothing.
+        """
+        tree = dict(self.tree, questions=[
+            {"text": "Name", "answer_type": "ta", "answers": [{"text": "Spam"}]}])
+        response = self.client.post('/api/surveys/tree/', tree, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Survey.objects.exists())
+
+        created = self.client.post('/api/surveys/tree/', self.tree, format='json').data
+        other = self.client.post('/api/surveys/tree/', self.tree, format='json').data
+        tree = dict(self.tree, questions=[
+            {"id": other['questions'][1]['id'], "text": "Name", "answer_type": "ta"}])
+        response = self.client.put(f'/api/surveys/{created["id"]}/tree/', tree, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Question.objects.get(pk=other['questions'][1]['id']).survey_id,
+                         other['id'])
+
+
+class SurveyCommitTests(APITestCase):
+
+
+    def setUp(self):
+        cache.clear()
+        self.survey = Survey.objects.create(
+                                            title="Test survey for commit",
+                                            start_date="2021-09-19T00:00:00",
+                                            finish_date="2021-10-30T00:00:00",
+                                            description="A survey for testing commits",
+                                            )
+        Question.objects.bulk_create(
+            Question(text=f"Question {i}", answer_type="ta", survey=self.survey)
+            for i in range(100))
+        self.questions = list(Question.objects.filter(survey=self.survey))
+        self.customer = Customer.objects.create()
+        self.commit_url = f'/api/customers/{self.customer.pk}/surveys/'
+
+
+    def commit(self, questions):
+        commit_data = {
+                "customer": self.customer.pk,
+                "survey": self.survey.pk,
+                "given_answers": [{"question": question.pk, "answer": "Answer"}
+                                  for question in questions]
+               }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.commit_url, commit_data, format='json')
+        return response, len(queries)
+
+
+    def test_commit_constant_queries(self):
+        """
+        Ensure a commit costs the same number of queries however many answers
+        are given, once the validation plan of the survey is compiled.
+        """
+        self.commit(self.questions[:1])
+        response, single_queries = self.commit(self.questions[:1])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response, queries = self.commit(self.questions)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(queries, single_queries)
+        self.assertEqual(GivenAnswer.objects.count(), 102)
+
+
+    def test_commit_choices_validated(self):
+        """
+        Ensure choices are checked against preset answers by the cached plan
+        without reading questions or answers, and the plan follows changes.
+        """
+        unique = Question.objects.create(text="Unique", answer_type="uv", survey=self.survey)
+        many = Question.objects.create(text="Many", answer_type="sv", survey=self.survey)
+        for question in (unique, many):
+            Answer.objects.bulk_create(Answer(text=text, question=question)
+                                       for text in ("Red", "Blue"))
+        self.commit(self.questions[:1])
+
+        for given_answers in ([(unique, "Green")],
+                              [(unique, "Red"), (unique, "Blue")],
+                              [(many, "Red"), (many, "Red")]):
+            commit_data = {
+                    "customer": self.customer.pk,
+                    "survey": self.survey.pk,
+                    "given_answers": [{"question": question.pk, "answer": text}
+                                      for question, text in given_answers]
+                   }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.commit_url, commit_data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'surveys_question' in query['sql']
+                              or 'surveys_answer' in query['sql']])
+
+        commit_data['given_answers'] = [{"question": unique.pk, "answer": "Green"},
+                                        {"question": many.pk, "answer": "Red"},
+                                        {"question": many.pk, "answer": "Blue"}]
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.create(text="Green", question=unique)
+        response = self.client.post(self.commit_url, commit_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+    def test_commit_foreign_question(self):
+        """
+        Ensure answers to questions of another survey are rejected.
+        """
+        other_survey = Survey.objects.create(title="Other",
+                                             start_date="2021-09-19T00:00:00",
+                                             description="Other survey")
+        other_question = Question.objects.create(text="Other", survey=other_survey)
+
+        response, queries = self.commit([self.questions[0], other_question])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CompletedSurvey.objects.exists())
+
+
+    @override_settings(SURVEY_COMMIT_MODE='queue')
+    def test_queued_commit(self):
+        """
+        Ensure a queued commit is accepted with a receipt, written by the
+        worker and not written again when the worker runs once more.
+        """
+        response, queries = self.commit(self.questions[:3])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(CompletedSurvey.objects.exists())
+        receipt_url = f'/api/commits/{response.data["receipt"]}/'
+
+        call_command('drain_commits', stdout=StringIO())
+        call_command('drain_commits', stdout=StringIO())
+
+        response = self.client.get(receipt_url)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['completed_survey'],
+                         CompletedSurvey.objects.get().pk)
+        self.assertEqual(GivenAnswer.objects.count(), 3)
+
+
+    @override_settings(SURVEY_SINGLE_COMMIT_PER_CUSTOMER=True)
+    def test_commit_once(self):
+        """
+        Ensure a customer can commit a survey only once when it is required.
+        """
+        response, queries = self.commit(self.questions[:1])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(GivenAnswer.objects.get().answered_at,
+                         CompletedSurvey.objects.get().created)
+
+        response, queries = self.commit(self.questions[:1])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CompletedSurvey.objects.count(), 1)
+
+
+    @override_settings(SURVEY_SINGLE_COMMIT_PER_CUSTOMER=True)
+    def test_concurrent_commit_once(self):
+        """
+        Ensure the database rejects a commit racing another commit of the
+        survey by the customer after both were validated.
+        """
+        validate = SurveyCommitSerializer.validate
+
+        def validate_racing(serializer, data):
+            data = validate(serializer, data)
+            CompletedSurvey.objects.create(customer=self.customer, survey=self.survey,
+                                           single=True)
+            return data
+
+        with mock.patch.object(SurveyCommitSerializer, 'validate', validate_racing):
+            response, queries = self.commit(self.questions[:1])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CompletedSurvey.objects.count(), 1)
+        self.assertFalse(GivenAnswer.objects.exists())
+
+
+class CustomerHistoryTests(APITestCase):
+
+
+    def setUp(self):
+        self.surveys = [Survey.objects.create(title=f"Survey {i}",
+                                              start_date="2021-09-19T00:00:00",
+                                              description="A survey for testing history")
+                        for i in range(2)]
+        self.questions = [Question.objects.create(text=f"Question {i}", answer_type="uv",
+                                                  survey=survey)
+                          for i, survey in enumerate(self.surveys)]
+        for question in self.questions:
+            Answer.objects.create(text="Yes", question=question)
+        self.customer = Customer.objects.create()
+        self.commit_url = f'/api/customers/{self.customer.pk}/surveys/'
+
+
+    def commit(self, number):
+        for index in range(number):
+            question = self.questions[index % 2]
+            self.client.post(self.commit_url, {
+                "customer": self.customer.pk,
+                "survey": question.survey_id,
+                "given_answers": [{"question": question.pk, "answer": "Yes"}]
+                }, format='json')
+
+
+    def history_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(queries)
+
+
+    def test_history_constant_queries(self):
+        """
+        Ensure the history and the list of completed surveys cost the same
+        number of queries however many completed surveys are listed.
+        """
+        history_url = f'/api/customers/{self.customer.pk}/history/'
+        self.commit(1)
+        history, single_queries = self.history_queries(history_url)
+        listing, single_list_queries = self.history_queries(self.commit_url)
+
+        self.commit(9)
+        history, queries = self.history_queries(history_url)
+        self.assertEqual(queries, single_queries)
+        self.assertEqual(len(history['results']), 10)
+        self.assertEqual(history['results'][0]['survey']['title'], 'Survey 0')
+        self.assertEqual(history['results'][0]['given_answers'][1],
+                         {'question': 'Question 0', 'answer': 'Yes'})
+
+        listing, queries = self.history_queries(self.commit_url)
+        self.assertEqual(queries, single_list_queries)
+
+
+    def test_history_filtered_by_survey(self):
+        """
+        Ensure the history is filtered by survey.
+        """
+        self.commit(3)
+        history, queries = self.history_queries(
+            f'/api/customers/{self.customer.pk}/history/?survey={self.surveys[1].pk}')
+
+        self.assertEqual([each['survey']['id'] for each in history['results']],
+                         [self.surveys[1].pk])
+
+
+    def test_archived_history(self):
+        """
+        Ensure archived completed surveys stay in the history and the list of
+        completed surveys, in order of ids across pages.
+        """
+        self.commit(4)
+        ids = list(CompletedSurvey.objects.order_by('id').values_list('id', flat=True))
+        self.surveys[0].finish_date = timezone.now() - timedelta(days=1)
+        self.surveys[0].save()
+        call_command('archive_responses', '--days', '0', stdout=StringIO())
+        self.assertEqual(ArchivedCompletedSurvey.objects.count(), 2)
+
+        history, queries = self.history_queries(
+            f'/api/customers/{self.customer.pk}/history/?page_size=3')
+        listed = history['results']
+        history, queries = self.history_queries(history['next'])
+        listed += history['results']
+        self.assertEqual([each['id'] for each in listed], ids)
+        self.assertEqual(listed[0]['survey']['title'], 'Survey 0')
+        self.assertEqual(listed[0]['given_answers'][1],
+                         {'question': 'Question 0', 'answer': 'Yes'})
+
+        history, queries = self.history_queries(
+            f'/api/customers/{self.customer.pk}/history/?survey={self.surveys[0].pk}')
+        self.assertEqual([each['id'] for each in history['results']], ids[::2])
+
+        listing, queries = self.history_queries(self.commit_url)
+        self.assertEqual([each['id'] for each in listing['results']], ids)
+
+
+class SurveyResultsTests(APITestCase):
+
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='spam', password='top_secret')
+        self.client.force_authenticate(user=self.user)
+        self.survey = Survey.objects.create(
+                                            title="Test survey for results",
+                                            start_date="2021-09-19T00:00:00",
+                                            description="A survey for testing results",
+                                            )
+        self.choice = Question.objects.create(text="Choice", answer_type="uv",
+                                              survey=self.survey)
+        self.text = Question.objects.create(text="Text", answer_type="ta",
+                                            survey=self.survey)
+        self.yes = Answer.objects.create(text="Yes", question=self.choice)
+        self.no = Answer.objects.create(text="No", question=self.choice)
+        self.customer = Customer.objects.create()
+
+        for choice in ("Yes", "Yes", "No"):
+            commit_data = {
+                    "customer": self.customer.pk,
+                    "survey": self.survey.pk,
+                    "given_answers": [{"question": self.choice.pk, "answer": choice},
+                                      {"question": self.text.pk, "answer": "Text"}]
+                   }
+            self.client.post(f'/api/customers/{self.customer.pk}/surveys/',
+                             commit_data, format='json')
+
+
+    def assertResults(self, results):
+        self.assertEqual(results['questions'][1]['given_answers'], 3)
+        self.assertEqual([answer['count'] for answer in results['questions'][1]['answers']],
+                         [2, 1])
+        self.assertEqual(results['questions'][2]['given_answers'], 3)
+
+
+    def test_results_counted_on_commit(self):
+        """
+        Ensure results are counted while survey commits are written.
+        """
+        response = self.client.get(f'/api/surveys/{self.survey.pk}/results/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertResults(response.data)
+
+
+    def test_choices_referenced(self):
+        """
+        Ensure chosen preset answers are stored by reference without their
+        text and read with it.
+        """
+        self.assertEqual(GivenAnswer.objects.filter(choice=self.yes, answer='').count(), 2)
+        self.assertEqual(GivenAnswer.objects.filter(question=self.text, choice=None,
+                                                     answer='Text').count(), 3)
+
+        completed_survey = CompletedSurvey.objects.first()
+        response = self.client.get(
+            f'/api/customers/{self.customer.pk}/surveys/{completed_survey.pk}/')
+        self.assertEqual(response.data['given_answers'][1]['answer'], 'Yes')
+
+
+    def test_deleted_choice_text_kept(self):
+        """
+        Ensure given answers keep the text of a chosen preset answer which is
+        deleted, one by one or in bulk.
+        """
+        self.yes.delete()
+        Answer.objects.filter(pk=self.no.pk).delete()
+
+        self.assertEqual(sorted(GivenAnswer.objects.filter(
+            question=self.choice, choice=None).values_list('answer', flat=True)),
+            ['No', 'Yes', 'Yes'])
+        completed_survey = CompletedSurvey.objects.first()
+        response = self.client.get(
+            f'/api/customers/{self.customer.pk}/surveys/{completed_survey.pk}/')
+        self.assertEqual(response.data['given_answers'][1]['answer'], 'Yes')
+
+
+    def test_results_rebuilt(self):
+        """
+        Ensure rebuilding results from given answers gives the same numbers.
+        """
+        call_command('rebuild_answer_stats', stdout=StringIO())
+        response = self.client.get(f'/api/surveys/{self.survey.pk}/results/')
+
+        self.assertResults(response.data)
+
+
+    def test_export_streamed(self):
+        """
+        Ensure given answers of a survey are streamed as CSV and as NDJSON.
+        """
+        response = self.client.get(f'/api/surveys/{self.survey.pk}/export/?output=csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'completed_survey,customer,created,question,'
+                                   'question_text,choice,answer')
+        self.assertEqual(len(lines), 7)
+
+        response = self.client.get(f'/api/surveys/{self.survey.pk}/export/'
+                                   f'?customer={self.customer.pk}&since=2000-01-01T00:00:00')
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['answer'] for row in rows[:2]], ["Yes", "Text"])
+        self.assertEqual([row['choice'] for row in rows[:2]], [self.yes.pk, None])
+        self.assertEqual(len(rows), 6)
+
+
+    def test_archived_responses_readable(self):
+        """
+        Ensure responses of a closed survey are moved into the archive and are
+        still read by the detail view, the export and the results rebuild.
+        """
+        completed_survey = CompletedSurvey.objects.order_by('pk').first()
+        self.survey.finish_date = timezone.now() - timedelta(days=1)
+        self.survey.save()
+        call_command('archive_responses', '--days', '0', '--batch-size', '2',
+                     stdout=StringIO())
+
+        self.assertFalse(CompletedSurvey.objects.exists())
+        self.assertFalse(GivenAnswer.objects.exists())
+        self.assertEqual(ArchivedCompletedSurvey.objects.count(), 3)
+
+        response = self.client.get(
+            f'/api/customers/{self.customer.pk}/surveys/{completed_survey.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['given_answers'][1]['answer'], 'Yes')
+        self.assertEqual(response.data['given_answers'][2]['question'], 'Text')
+
+        response = self.client.get(f'/api/surveys/{self.survey.pk}/export/?output=csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(lines[1].split(',')[-2:], [str(self.yes.pk), 'Yes'])
+
+        call_command('rebuild_answer_stats', stdout=StringIO())
+        self.assertResults(self.client.get(f'/api/surveys/{self.survey.pk}/results/').data)
+
+        self.yes.delete()
+        response = self.client.get(
+            f'/api/customers/{self.customer.pk}/surveys/{completed_survey.pk}/')
+        self.assertEqual(response.data['given_answers'][1]['answer'], 'Yes')
+
+
+    def test_export_command(self):
+        """
+        Ensure the export command writes the same rows as the endpoint.
+        """
+        output = StringIO()
+        call_command('export_responses', self.survey.pk, '--output-format', 'csv',
+                     '--until', '2000-01-01T00:00:00', stdout=output)
+
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+
+
+class PaginationTests(APITestCase):
+
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='spam', password='top_secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        for day in range(1, 6):
+            Survey.objects.create(title=f"Survey {day}",
+                                  start_date=f"2021-09-0{day}T00:00:00",
+                                  description="A survey for testing pagination")
+
+
+    def test_surveys_cursor_stable_on_insert(self):
+        """
+        Ensure surveys are paged newest first and a survey added between pages
+        neither shifts nor repeats the following pages.
+        """
+        response = self.client.get('/api/surveys/?page_size=2')
+        titles = [survey['title'] for survey in response.data['results']]
+
+        Survey.objects.create(title="Survey 6", start_date="2021-09-06T00:00:00",
+                              description="A survey added while paging")
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            titles += [survey['title'] for survey in response.data['results']]
+
+        self.assertEqual(titles, [f"Survey {day}" for day in range(5, 0, -1)])
+
+
+    def test_page_validated_by_its_rows(self):
+        """
+        Ensure the ETag of a page is computed from the rows of the page only
+        and changes when one of them changes or is deleted.
+        """
+        url = '/api/surveys/?page_size=2'
+        etag = self.client.get(url)['ETag']
+
+        Survey.objects.filter(title="Survey 1").update(modified=timezone.now())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('LIMIT 3', queries.captured_queries[-1]['sql'])
+
+        Survey.objects.filter(title="Survey 5").update(modified=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        etag = response['ETag']
+        Survey.objects.filter(title="Survey 4").delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ActiveSurveysTests(APITestCase):
+
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        Survey.objects.create(title="Open-ended", start_date=now - timedelta(days=1),
+                              description="A survey without a finish date")
+        Survey.objects.create(title="Finished", start_date=now - timedelta(days=2),
+                              finish_date=now - timedelta(days=1),
+                              description="A finished survey")
+        Survey.objects.create(title="Future", start_date=now + timedelta(days=1),
+                              description="A survey starting tomorrow")
+
+
+    def test_active_surveys_cached(self):
+        """
+        Ensure surveys without a finish date are listed, the listing is served
+        from the cache and listed again after a survey is added.
+        """
+        response = self.client.get('/api/surveys/')
+        self.assertEqual([survey['title'] for survey in response.data['results']],
+                         ["Open-ended"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/surveys/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Survey.objects.create(title="Current", start_date=timezone.now(),
+                                  finish_date=timezone.now() + timedelta(days=1),
+                                  description="A survey started now")
+        response = self.client.get('/api/surveys/')
+        self.assertEqual([survey['title'] for survey in response.data['results']],
+                         ["Current", "Open-ended"])
+
+
+class BenchmarkTests(APITestCase):
+
+
+    def test_benchmark_generated_data(self):
+        """
+        Ensure generated data can be benchmarked and results are written.
+        """
+        call_command('generate_data', '--surveys', '1', '--questions', '3',
+                     '--customers', '2', '--completed', '2', stdout=StringIO())
+        self.assertEqual(CompletedSurvey.objects.count(), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark', '--requests', '2', '--warmup', '0',
+                         '--memory-requests', '1', '--output', output, stdout=StringIO())
+            with open(output) as results:
+                scenarios = json.load(results)['scenarios']
+
+        self.assertEqual(scenarios['survey_commit']['statuses'], [201])
+        self.assertEqual(scenarios['survey_detail']['statuses'], [200])
+
+
+    def test_benchmark_serialization(self):
+        """
+        Ensure serialization is benchmarked and results are written.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark_serialization.json')
+            call_command('benchmark_serialization', '--items', '2', '--repeat', '1',
+                         '--output', output, stdout=StringIO())
+            with open(output) as results:
+                resources = json.load(results)['resources']
+
+        self.assertEqual(set(resources), {'survey', 'answer', 'given_answer'})
+
+
+class RendererTests(APITestCase):
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_render_and_parse(self):
+        """
+        Ensure the fast renderer writes integer keys as strings and the parser reads it back.
+        """
+        data = {1: {'text': 'Question', 'modified': timezone.now()}}
+        rendered = renderers.FastJSONRenderer().render(data)
+        parsed = renderers.FastJSONParser().parse(BytesIO(rendered))
+        self.assertEqual(list(parsed), ['1'])
+        self.assertEqual(parsed['1']['text'], 'Question')
+
+
+    def test_fallback_without_orjson(self):
+        """
+        Ensure the same document is rendered when orjson is not installed, for
+        an uncached history with numbered answers, datetimes and non-ASCII text.
+        """
+        survey = Survey.objects.create(title="Survey", start_date="2021-09-19T00:00:00",
+                                       description="A survey for testing rendering")
+        choice = Question.objects.create(text="Colour", answer_type="uv", survey=survey)
+        Answer.objects.create(text="Red", question=choice)
+        text = Question.objects.create(text="Name", answer_type="ta", survey=survey)
+        customer = Customer.objects.create()
+        response = self.client.post(f'/api/customers/{customer.pk}/surveys/', {
+            "customer": customer.pk,
+            "survey": survey.pk,
+            "given_answers": [{"question": choice.pk, "answer": "Red"},
+                              {"question": text.pk, "answer": "Zoë ✓"}]
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        url = f'/api/customers/{customer.pk}/history/'
+        with mock.patch.object(renderers.orjson, 'dumps', wraps=renderers.orjson.dumps) as dumps:
+            response = self.client.get(url)
+        self.assertTrue(dumps.called)
+        with mock.patch.object(renderers, 'orjson', None):
+            fallback = self.client.get(url)
+        document = json.loads(response.content)
+        self.assertEqual(json.loads(fallback.content), document)
+        self.assertEqual(document['results'][0]['given_answers']['2'],
+                         {'question': 'Name', 'answer': 'Zoë ✓'})
+        self.assertIn('created', document['results'][0])
+
+
+class SchemaTests(APITestCase):
+
+
+    def test_committed_schema_up_to_date(self):
+        """
+        Ensure the committed schema is the one generated from the code, run
+        generate_schema after changing the API.
+        """
+        call_command('generate_schema', '--check', stdout=StringIO())
+
+
+    def test_schema_served_with_etag(self):
+        """
+        Ensure the schema is served from the committed file with caching
+        headers and revalidated by its ETag.
+        """
+        response = self.client.get('/api/swagger.json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, schema.SCHEMA_PATH.read_bytes())
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get('/api/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class InstrumentationTests(APITestCase):
+
+
+    @override_settings(PERF_QUERY_LOG_THRESHOLD=0)
+    def test_request_instrumented(self):
+        """
+        Ensure requests get a Server-Timing header, are aggregated in metrics
+        served only with the metrics token, and their SQL is logged above the
+        threshold of queries.
+        """
+        survey = Survey.objects.create(title="Instrumented",
+                                       start_date="2021-09-19T00:00:00",
+                                       description="A survey for instrumentation")
+        with self.assertLogs('api.instrumentation', level='WARNING') as logs:
+            response = self.client.get(f'/api/surveys/{survey.pk}/')
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('SELECT', logs.output[0])
+
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN='spam'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer eggs')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer späm')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer spam')
+        self.assertIn('http_request_db_queries_count{method="GET",'
+                      'route="api/surveys/<int:pk>/"}', response.content.decode())
+
+
+class AsyncViewsTests(APITransactionTestCase):
+
+
+    def test_pooled_view(self):
+        """
+        Ensure a view run by an async view in the pool of threads reads the
+        database and returns a rendered response.
+        """
+        survey = Survey.objects.create(title="Async survey",
+                                       start_date="2021-09-19T00:00:00",
+                                       description="A survey read asynchronously")
+        view = pooled_view(SurveyDetailView.as_view())
+        request = RequestFactory().get(f'/api/surveys/{survey.pk}/')
+
+        response = async_to_sync(view)(request, pk=survey.pk)
+
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        self.assertEqual(json.loads(response.content)['title'], "Async survey")
+
+
+    @override_settings(MIDDLEWARE=['api.instrumentation.PerformanceMiddleware',
+                                   'SurveyProject.replicas.ReplicaMiddleware'])
+    def test_middleware_concurrent(self):
+        """
+        Ensure the middleware runs asynchronously under ASGI, so requests to
+        pooled views of a worker are served concurrently.
+        """
+        def slow_view(request):
+            time.sleep(0.5)
+            return HttpResponse()
+
+        class urlconf:
+            urlpatterns = [path('slow/', pooled_view(slow_view))]
+
+        handler = BaseHandler()
+        handler.load_middleware(is_async=True)
+
+        async def get_concurrently(count):
+            requests = [RequestFactory().get('/slow/') for i in range(count)]
+            for request in requests:
+                request.urlconf = urlconf
+            return await asyncio.gather(*map(handler.get_response_async, requests))
+
+        started = time.perf_counter()
+        responses = async_to_sync(get_concurrently)(4)
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+
+
+class TokenCacheTests(APITestCase):
+
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='spam', password='top_secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+
+    def test_token_cached_until_deleted(self):
+        """
+        Ensure a token is resolved once and is rejected once deleted.
+        """
+        with self.assertNumQueries(2):
+            self.client.get('/api/customers/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/customers/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.token.delete()
+        response = self.client.get('/api/customers/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+    def test_deactivated_user_rejected(self):
+        """
+        Ensure a cached token of a deactivated user is rejected.
+        """
+        self.client.get('/api/customers/')
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get('/api/customers/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_HEALTH_CHECK_INTERVAL=60)
+class ReplicaRoutingTests(APITestCase):
+
+
+    def setUp(self):
+        # Sticky windows have to be kept in a cache shared by processes.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared_caches = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }})
+        shared_caches.enable()
+        self.addCleanup(shared_caches.disable)
+        replicas._health.clear()
+        self.factory = RequestFactory()
+
+        def view(request):
+            return HttpResponse(router.db_for_read(Survey), status=201)
+        view.replica_reads = True
+
+        def get_response(request):
+            self.middleware.process_view(request, view, (), {})
+            return view(request)
+        self.middleware = replicas.ReplicaMiddleware(get_response)
+
+
+    def request(self, method, token):
+        request = getattr(self.factory, method)('/', HTTP_AUTHORIZATION=f'Token {token}')
+        return self.middleware(request).content.decode()
+
+
+    def test_reads_routed_and_sticky_after_write(self):
+        """
+        Ensure reads go to the replica except for a client which has just written.
+        """
+        with mock.patch.object(replicas, 'check_replica', return_value=True):
+            self.assertEqual(self.request('get', 'spam'), 'replica_1')
+            self.assertEqual(self.request('post', 'spam'), 'default')
+            self.assertEqual(self.request('get', 'spam'), 'default')
+            self.assertEqual(self.request('get', 'eggs'), 'replica_1')
+
+
+    def test_unhealthy_replica_skipped(self):
+        """
+        Ensure reads fall back to the default database while the replica is
+        unhealthy, which is checked once in the check interval.
+        """
+        with mock.patch.object(replicas, 'check_replica', return_value=False) as check:
+            self.assertEqual(self.request('get', 'spam'), 'default')
+            self.assertEqual(self.request('get', 'spam'), 'default')
+        self.assertEqual(check.call_count, 1)
+
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_refused(self):
+        """
+        Ensure replicas are not used with a cache local to the process, where
+        other processes would not see a client's sticky window.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            replicas.ReplicaMiddleware(lambda request: HttpResponse())
+
+
+class CommitAdmissionTests(APITestCase):
+
+
+    def setUp(self):
+        throttling.local_buckets.clear()
+        admission_controller.reset()
+        self.survey = Survey.objects.create(title="Test survey for throttling",
+                                            start_date="2021-09-19T00:00:00")
+        self.question = Question.objects.create(text="Question", answer_type="ta",
+                                                survey=self.survey)
+
+
+    def commit(self, customer, **extra):
+        return self.client.post(f'/api/customers/{customer.pk}/surveys/',
+                                {"customer": customer.pk, "survey": self.survey.pk,
+                                 "given_answers": [{"question": self.question.pk,
+                                                    "answer": "Answer"}]},
+                                format='json', **extra)
+
+
+    @override_settings(COMMIT_THROTTLE_RATES={'customer': '2/min', 'address': None,
+                                              'global': None})
+    def test_commits_throttled_per_customer(self):
+        """
+        Ensure a customer is throttled after a burst of commits while others
+        are not, and reads are never throttled.
+        """
+        customer, other = Customer.objects.create(), Customer.objects.create()
+        for i in range(2):
+            self.assertEqual(self.commit(customer).status_code, status.HTTP_201_CREATED)
+        response = self.commit(customer)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.commit(other).status_code, status.HTTP_201_CREATED)
+        response = self.client.get(f'/api/customers/{customer.pk}/surveys/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+    @override_settings(COMMIT_THROTTLE_RATES={'customer': None, 'address': '1/min',
+                                              'global': None})
+    def test_spoofed_forwarded_address_throttled(self):
+        """
+        Ensure a client changing X-Forwarded-For is throttled by the address
+        of its connection.
+        """
+        customer = Customer.objects.create()
+        response = self.commit(customer, HTTP_X_FORWARDED_FOR='1.1.1.1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.commit(customer, HTTP_X_FORWARDED_FOR='2.2.2.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+    @override_settings(COMMIT_THROTTLE_RATES={'customer': '1/min', 'address': None,
+                                              'global': None},
+                       COMMIT_THROTTLE_BACKEND='cache')
+    def test_cache_backend_shared(self):
+        """
+        Ensure cached buckets are kept in a cache shared by processes, and a
+        cache local to the process is refused.
+        """
+        customer = Customer.objects.create()
+        with self.assertRaises(ImproperlyConfigured):
+            self.commit(customer)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                            'LOCATION': directory}}):
+            self.assertEqual(self.commit(customer).status_code, status.HTTP_201_CREATED)
+            throttling.local_buckets.clear()
+            response = self.commit(customer)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+    def test_commits_shed_when_overloaded(self):
+        """
+        Ensure commits are shed with 503 while too many are in flight or
+        their latency is too high.
+        """
+        customer = Customer.objects.create()
+        with override_settings(ADMISSION_MAX_IN_FLIGHT=0):
+            response = self.commit(customer)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+        admission_controller.admit()
+        admission_controller.release(20.0)
+        response = self.commit(customer)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(admission_controller.in_flight, 0)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class IdempotencyKeyTests(APITestCase):
+
+
+    def setUp(self):
+        self.survey = Survey.objects.create(title="Test survey for retries",
+                                            start_date="2021-09-19T00:00:00")
+        self.question = Question.objects.create(text="Question", answer_type="ta",
+                                                survey=self.survey)
+        self.customer = Customer.objects.create()
+
+
+    def commit(self, key, answer="Answer"):
+        return self.client.post(f'/api/customers/{self.customer.pk}/surveys/',
+                                {"customer": self.customer.pk, "survey": self.survey.pk,
+                                 "given_answers": [{"question": self.question.pk,
+                                                    "answer": answer}]},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+
+    def test_retry_replayed(self):
+        """
+        Ensure a retry with the same key gets the first response without
+        writing the commit again, and a key reused for another request is
+        rejected.
+        """
+        response = self.commit('spam')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.commit('spam')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(CompletedSurvey.objects.count(), 1)
+
+        response = self.commit('spam', answer="Other")
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.commit('eggs').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CompletedSurvey.objects.count(), 2)
+
+
+    def test_failed_and_expired_keys_not_replayed(self):
+        """
+        Ensure invalid commits do not keep their key, and expired keys are
+        written again or deleted by the purge command.
+        """
+        response = self.commit('spam', answer="")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.commit('spam')
+        self.commit('eggs')
+        IdempotencyKey.objects.update(expires=timezone.now())
+        self.assertEqual(self.commit('spam').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CompletedSurvey.objects.count(), 3)
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['spam'])
+
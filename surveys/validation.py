@@ -0,0 +1,81 @@
+'''
+Validation of given answers of survey commits against a plan compiled from
+the questions and preset answers of the survey.
+
+A plan maps ids of the survey's questions to their answer type, the set of
+texts of their preset answers and the ids of preset answers by text. Plans
+are cached under the survey version, which is bumped by every change of the
+survey, its questions or answers, so a commit is validated in memory without
+queries while the survey is unchanged.
+'''
+from collections import defaultdict
+
+from . import cache
+from .models import Question, Answer
+
+
+def compile_plan(survey_id):
+    choices = defaultdict(dict)
+    for question_id, text, pk in Answer.objects.filter(
+            question__survey=survey_id
+            ).order_by('pk').values_list('question_id', 'text', 'pk'):
+        choices[question_id].setdefault(text, pk)
+
+    return {pk: (answer_type, frozenset(choices[pk]), choices[pk])
+            for pk, answer_type in Question.objects.filter(
+                survey=survey_id
+                ).values_list('pk', 'answer_type')}
+
+
+def get_plan(survey_id):
+    '''
+    Returns the validation plan of the survey, compiled once per version.
+    '''
+    if survey_id is None:
+        return {}
+    version = cache.get_version(survey_id)
+    plan = cache.get_plan(survey_id, version)
+    if plan is None:
+        plan = compile_plan(survey_id)
+        cache.set_plan(survey_id, version, plan)
+    return plan
+
+
+def check_given_answers(plan, given_answers):
+    '''
+    Returns a list of errors of given answers, pairs of a question id and an
+    answer text. Questions should belong to the survey, a unique variant
+    question takes exactly one of its preset answers, a set of variants
+    question takes distinct preset answers. Choice questions without preset
+    answers take any text.
+    '''
+    given = defaultdict(list)
+    for question_id, text in given_answers:
+        given[question_id].append(text)
+
+    foreign = sorted(question_id for question_id in given if question_id not in plan)
+    if foreign:
+        return [f'Questions {", ".join(map(str, foreign))} do not belong to the survey']
+
+    errors = []
+    for question_id, texts in given.items():
+        answer_type, options, choices = plan[question_id]
+        if answer_type == 'ta' or not options:
+            continue
+        if answer_type == 'uv' and (len(texts) != 1 or texts[0] not in options):
+            errors.append(f'Question {question_id} takes exactly one of its preset answers')
+        elif answer_type == 'sv' and (len(set(texts)) != len(texts)
+                                      or not options.issuperset(texts)):
+            errors.append(f'Question {question_id} takes distinct preset answers')
+    return errors
+
+
+def choice_id(plan, question_id, text):
+    '''
+    Returns the id of the preset answer given by its text, None for text
+    answers and texts matching no preset answer.
+    '''
+    answer_type, options, choices = plan[question_id]
+    if answer_type == 'ta':
+        return None
+    return choices.get(text)